@@ -0,0 +1,100 @@
+"""
+Writes a synthetic lyrics tree that `Library` can load, with album
+JSON files next to directories of songs. Words are drawn from a
+made-up vocabulary with Zipfian frequencies, and every artist favours
+a slightly different set of words so that artists can be told apart.
+
+$ python -m benchmarks.corpus /tmp/lyrics --songs 10000 --artists 20
+"""
+import os
+import json
+import argparse
+import numpy as np
+
+syllables = ['ba', 'ko', 'ri', 'mu', 'se', 'ta', 'no', 'li', 'da', 've',
+             'ga', 'zu', 'pe', 'lo', 'chi', 'ra', 'mi', 'to', 'ne', 'yo']
+
+
+def made_up_word(i):
+    """Return a distinct word of syllables for every i >= 0."""
+    word = ''
+    while True:
+        i, j = divmod(i, len(syllables))
+        word += syllables[j]
+        if i == 0:
+            return word
+        i -= 1
+
+def zipf_cumulative(size, exponent):
+    """Cumulative probabilities of ranks 1..size under Zipf's law."""
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    cumulative = np.cumsum(weights)
+    return cumulative / cumulative[-1]
+
+def artist_ranks(size, rng, shuffled=0.2, head=1000):
+    """Order the vocabulary by how often an artist uses each word:
+    a fraction of the most common words swap ranks with one another.
+    """
+
+    ranks = np.arange(size)
+    head = min(head, size)
+    chosen = rng.choice(head, size=int(head * shuffled) // 2 * 2, replace=False)
+    ranks[chosen] = ranks[rng.permutation(chosen)]
+    return ranks
+
+def generate(root, songs=1000, artists=10, songs_per_album=12, words_per_song=250,
+             vocabulary=20000, exponent=1.07, seed=0):
+    """Write `songs` songs split between `artists` artists under
+    `root` and return the paths of the album files.
+    """
+
+    rng = np.random.default_rng(seed)
+    words = np.array([made_up_word(i) for i in range(vocabulary)])
+    cumulative = zipf_cumulative(vocabulary, exponent)
+    album_files = []
+    for artist in range(artists):
+        ranks = artist_ranks(vocabulary, rng)
+        # spread the songs as evenly as possible between artists
+        artist_songs = songs // artists + (artist < songs % artists)
+        for album, start in enumerate(range(0, artist_songs, songs_per_album)):
+            directory = os.path.join(root, 'artist%03d' % artist, 'album%03d' % album)
+            os.makedirs(directory, exist_ok=True)
+            titles = []
+            for track in range(min(songs_per_album, artist_songs - start)):
+                length = int(rng.integers(words_per_song // 2, words_per_song * 3 // 2 + 1))
+                tokens = words[ranks[np.searchsorted(cumulative, rng.random(length))]]
+                title = ' '.join(tokens[:3]).title()
+                lines = [' '.join(tokens[i:i + 8]) for i in range(0, length, 8)]
+                with open(os.path.join(directory, '%02d.txt' % track), 'w') as f:
+                    f.write(title + '\n\n' + '\n'.join(lines))
+                titles.append(title)
+            album_file = directory + '.json'
+            with open(album_file, 'w') as f:
+                json.dump({'artist': 'Artist %d' % artist,
+                           'album': 'Album %d' % album,
+                           'songs': titles}, f, indent=4)
+            album_files.append(album_file)
+    return album_files
+
+def add_arguments(parser):
+    parser.add_argument('--songs', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=10)
+    parser.add_argument('--songs-per-album', type=int, default=12)
+    parser.add_argument('--words-per-song', type=int, default=250)
+    parser.add_argument('--vocabulary', type=int, default=20000)
+    parser.add_argument('--exponent', type=float, default=1.07,
+                        help='exponent of the Zipf distribution of words')
+    parser.add_argument('--seed', type=int, default=0)
+
+def corpus_options(args):
+    return {'songs': args.songs, 'artists': args.artists,
+            'songs_per_album': args.songs_per_album, 'words_per_song': args.words_per_song,
+            'vocabulary': args.vocabulary, 'exponent': args.exponent, 'seed': args.seed}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write a synthetic lyrics tree.')
+    parser.add_argument('root')
+    add_arguments(parser)
+    args = parser.parse_args()
+    album_files = generate(args.root, **corpus_options(args))
+    print("Wrote {} songs in {} albums under {}".format(args.songs, len(album_files), args.root))
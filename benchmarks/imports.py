@@ -0,0 +1,56 @@
+"""
+Times how long importing each lexicon module takes in a fresh
+interpreter, along with the whole run of that interpreter, and lists
+the heavy dependencies each one pulls in, so that short-lived commands
+and worker processes stay quick to start. An interpreter that imports
+nothing is shown for scale.
+
+$ python -m benchmarks.imports
+$ python -m benchmarks.imports lexicon.music lexicon.store --repeat 10
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+from statistics import median
+
+modules = ['lexicon.music', 'lexicon.tfidf', 'lexicon.store', 'lexicon.markov',
+           'lexicon.similarity', 'lexicon.clusterer', 'lexicon.genius']
+heavy = ['nltk', 'numpy', 'scipy', 'requests', 'bs4', 'aiohttp']
+
+script = """
+import sys, json, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [name for name in {heavy!r} if name in sys.modules]]))
+"""
+
+def time_import(module):
+    """Return the seconds an import of module takes in a new
+    interpreter, the seconds the whole interpreter runs for,
+    and the heavy dependencies it loaded.
+    """
+
+    statement = 'import ' + module if module else 'pass'
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', script.format(statement=statement, heavy=heavy)],
+                            check=True, capture_output=True, text=True).stdout
+    process = time.perf_counter() - start
+    seconds, loaded = json.loads(output)
+    return seconds, process, loaded
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the imports of lexicon modules.')
+    parser.add_argument('modules', nargs='*', default=modules)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print("{:<20} {:>10} {:>10} {:>10}  {}".format('module', 'import', 'best', 'process', 'loads'))
+    for module in [None] + args.modules:
+        runs = [time_import(module) for _ in range(args.repeat)]
+        seconds = [run[0] for run in runs]
+        print("{:<20} {:>9.3f}s {:>9.3f}s {:>9.3f}s  {}".format(
+            module or '(nothing)', median(seconds), min(seconds),
+            median(run[1] for run in runs), ' '.join(runs[0][2])))
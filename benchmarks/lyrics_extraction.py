@@ -0,0 +1,72 @@
+"""
+Compares pages per second and peak memory of extracting lyrics
+with BeautifulSoup against the streaming `LyricsParser`, and checks
+that both give the same lyrics for every page.
+
+Reads saved lyrics pages from a directory of .html files,
+or makes up pages shaped like genius.com if none is given.
+
+$ python -m benchmarks.lyrics_extraction pages/
+"""
+import os
+import sys
+import time
+import random
+import tracemalloc
+
+from lexicon.genius import extract_lyrics
+
+
+def saved_pages(directory):
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.html'):
+            with open(os.path.join(directory, name), encoding='utf8') as f:
+                yield f.read()
+
+def synthetic_page(verses=6):
+    """Return a page with a large head and footer around the lyrics."""
+    words = ['love', 'baby', 'yeah', 'money', 'night', 'loyalty', 'royalty', '&amp;']
+    def line():
+        return ' '.join(random.choices(words, k=8))
+    head = ''.join('<script>var config{} = {{"a": [1, 2, 3]}};</script>\n'.format(i)
+                   for i in range(200))
+    nav = ''.join('<li><a href="/artists/{0}">Artist {0}</a></li>\n'.format(i)
+                  for i in range(500))
+    lyrics = ''.join('[Verse {}]<br>\n'.format(v) +
+                     ''.join('<a href="/annotation">{}</a><br>\n'.format(line()) for _ in range(8))
+                     for v in range(verses))
+    footer = ''.join('<div class="comment"><p>{}</p></div>\n'.format(line())
+                     for _ in range(2000))
+    return ('<html><head>{}</head><body><ul>{}</ul>'
+            '<div class="song_body"><div class="lyrics">'
+            '<style>.lyrics a {{ color: inherit; }}</style><p>\n{}</p></div></div>'
+            '{}</body></html>').format(head, nav, lyrics, footer)
+
+def measure(pages, parser):
+    start = time.perf_counter()
+    for page in pages:
+        extract_lyrics(page, parser)
+    elapsed = time.perf_counter() - start
+
+    # tracing slows everything down, so memory is measured on its own
+    tracemalloc.start()
+    for page in pages:
+        extract_lyrics(page, parser)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return len(pages) / elapsed, peak
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        pages = list(saved_pages(sys.argv[1]))
+    else:
+        pages = [synthetic_page() for _ in range(20)]
+
+    for page in pages:
+        assert extract_lyrics(page, 'soup') == extract_lyrics(page, 'stream')
+    print("Lyrics are identical in all {} pages".format(len(pages)))
+
+    for parser in ('soup', 'stream'):
+        pages_per_second, peak = measure(pages, parser)
+        print("{:6}: {:8.1f} pages/s, peak memory {:8.1f} KiB".format(
+            parser, pages_per_second, peak / 1024))
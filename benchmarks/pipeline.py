@@ -0,0 +1,188 @@
+"""
+Times each stage of the lexicon pipeline on a synthetic corpus and
+measures the peak memory it allocates, then writes the results as
+JSON. Given a baseline written by an earlier run, stages that became
+slower or hungrier than the tolerance allows are flagged and the
+exit status is 1. Runs offline.
+
+$ python -m benchmarks.pipeline --songs 1000 --output before.json
+$ python -m benchmarks.pipeline --songs 1000 --baseline before.json
+
+Every stage is run twice: once to time it, then once more under
+tracemalloc for its peak memory, since tracing slows Python code down.
+tracemalloc only sees the process it runs in, so the second run keeps
+all of the work of a stage in this process, whatever `--processes` is.
+Both runs of `load` start from an empty vocabulary and normalizer
+caches, so neither benefits from the words the other has seen.
+
+A baseline only compares with a run of the same corpus and options.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+from benchmarks.corpus import generate, add_arguments, corpus_options
+from lexicon import music
+from lexicon.music import Library
+from lexicon.cache import TokenCache
+from lexicon.tfidf import CorpusIndex, TfidfVectorizer, tfidf
+from lexicon.clusterer import Clusterer
+from lexicon.evaluation import cross_validate
+
+
+def load(state, options):
+    library = Library(state['root'], processes=options['processes'])
+    state['artists'] = len(library.artists)
+    state['songs'], state['labels'] = [], []
+    for artist in library.artists:
+        for song in artist.songs():
+            state['songs'].append(song)
+            state['labels'].append(artist.name)
+
+def score_words(state, options):
+    index = CorpusIndex(state['songs'])
+    for song in state['songs'][:options['sample']]:
+        for word in song.lexicon:
+            tfidf(word, song, index)
+
+def important_words(state, options):
+    vectorizer = TfidfVectorizer()
+    state['matrix'] = vectorizer.fit_transform(state['songs'])
+    vectorizer.important_words(state['matrix'], n=10)
+
+def k_means(state, options):
+    Clusterer(algorithm='hamerly').fit(state['matrix'], state['artists'],
+                                       iterations=options['iterations'], seed=0)
+
+def classifier(state, options):
+    cross_validate(state['songs'], state['labels'], k=options['folds'], n=10,
+                   processes=options['processes'], seed=0)
+
+stages = [('load', load),
+          ('tfidf', score_words),
+          ('important_words', important_words),
+          ('k_means', k_means),
+          ('classifier', classifier)]
+
+def forget_words():
+    """Empty the shared vocabulary and the memoized normalizers,
+    as in a process that has not loaded any songs yet.
+    """
+
+    music.vocabulary = music.Vocabulary()
+    music.normalizers.clear()
+
+def run(root, options):
+    """Return the seconds and peak bytes of every stage."""
+    state, results = {'root': root}, {}
+    for name, stage in stages:
+        if stage is load:
+            forget_words()
+        start = time.perf_counter()
+        stage(state, options)
+        seconds = time.perf_counter() - start
+
+        if stage is load:
+            forget_words()
+        tracemalloc.start()
+        stage(state, dict(options, processes=1))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results[name] = {'seconds': seconds, 'peak_bytes': peak}
+        print("{:<16} {:>9.3f}s {:>10.1f} MiB".format(name, seconds, peak / 2**20))
+    return results
+
+def compare(report, baseline, tolerance, noise=0.05):
+    """Return a line for every stage that is slower or uses more memory
+    than its baseline by more than `tolerance`, a fraction. Differences
+    under `noise` seconds are ignored. Raises ValueError if the baseline
+    was run on another corpus or with other options.
+    """
+
+    for key in ('corpus', 'options'):
+        if report[key] != baseline.get(key):
+            raise ValueError("the baseline was run with {} {}, not {}".format(
+                key, baseline.get(key), report[key]))
+    regressions = []
+    for name, result in report['stages'].items():
+        before = baseline['stages'].get(name)
+        if before is None:
+            continue
+        seconds, then = result['seconds'], before['seconds']
+        if seconds > then * (1 + tolerance) and seconds - then > noise:
+            regressions.append("{}: {:.3f}s, was {:.3f}s".format(name, seconds, then))
+        peak, then = result['peak_bytes'], before['peak_bytes']
+        if peak > then * (1 + tolerance):
+            regressions.append("{}: {:.1f} MiB, was {:.1f} MiB".format(
+                name, peak / 2**20, then / 2**20))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the lexicon pipeline.')
+    add_arguments(parser)
+    parser.add_argument('--root', help='benchmark an existing lyrics tree instead')
+    parser.add_argument('--keep', action='store_true', help='keep the generated corpus')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--sample', type=int, default=100,
+                        help='number of songs whose every word is scored by tfidf')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--cache', action='store_true',
+                        help='use a token cache, in a temporary directory')
+    parser.add_argument('--output', help='file to write the results to')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    # never touch the token cache in the home directory; the variable
+    # is set as well for worker processes that import music afresh
+    cache_directory = tempfile.mkdtemp(prefix='lexicon-cache-') if args.cache else ''
+    os.environ['LEXICON_CACHE'] = cache_directory
+    music.token_cache = TokenCache(cache_directory) if args.cache else None
+    options = {'processes': args.processes, 'sample': args.sample,
+               'iterations': args.iterations, 'folds': args.folds}
+
+    root = args.root
+    corpus = None
+    if root is None:
+        corpus = corpus_options(args)
+        root = tempfile.mkdtemp(prefix='lexicon-benchmark-')
+        start = time.perf_counter()
+        generate(root, **corpus)
+        print("Generated {} songs in {:.1f}s under {}".format(
+            args.songs, time.perf_counter() - start, root))
+    try:
+        results = run(root, options)
+    finally:
+        if corpus is not None and not args.keep:
+            shutil.rmtree(root)
+        if cache_directory:
+            shutil.rmtree(cache_directory)
+
+    report = {'corpus': corpus or {'root': root},
+              'options': options,
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'stages': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(report, baseline, args.tolerance)
+        except ValueError as e:
+            sys.exit("Cannot compare: {}".format(e))
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+        print("No stage regressed by more than {:.0%}".format(args.tolerance))
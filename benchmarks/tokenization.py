@@ -0,0 +1,61 @@
+"""
+Compares tokens per second of `tokenize_file` against
+a `PlaintextCorpusReader` using `tokenizer`, and checks
+that both give the same tokens for every file.
+
+$ python -m benchmarks.tokenization lyrics/
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+from nltk.corpus import PlaintextCorpusReader
+
+from lexicon.music import tokenizer, tokenize_file
+
+
+def lyrics_files(root):
+    for directory, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if name.endswith('.txt'):
+                yield os.path.join(directory, name)
+
+def synthetic_files(directory, n=200, lines=60):
+    """Write n made-up lyrics files for when there are none to read."""
+    words = ["I'm", "don't", 'love', 'U.S.A.', '100%', 'baby', 'yeah', 'D.N.A.',
+             'night', 'money', 'rock-n-roll', '&', 'the', 'you', 'me', '3.5']
+    for i in range(n):
+        path = os.path.join(directory, '%03d.txt' % i)
+        with open(path, 'w') as f:
+            for _ in range(lines):
+                f.write(' '.join(random.choices(words, k=8)) + ',\n')
+        yield path
+
+def reader_tokens(path):
+    directory, name = os.path.split(path)
+    return list(PlaintextCorpusReader(directory or '.', name, word_tokenizer=tokenizer).words())
+
+def direct_tokens(path):
+    return list(tokenize_file(path))
+
+def tokens_per_second(tokenize, paths):
+    start = time.perf_counter()
+    tokens = sum(len(tokenize(path)) for path in paths)
+    return tokens / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    root = sys.argv[1] if len(sys.argv) > 1 else 'lyrics'
+    paths = list(lyrics_files(root))
+    if not paths:
+        paths = list(synthetic_files(tempfile.mkdtemp()))
+
+    for path in paths:
+        assert reader_tokens(path) == direct_tokens(path), 'tokens differ in ' + path
+    print("Tokens are identical in all {} files".format(len(paths)))
+
+    reader = tokens_per_second(reader_tokens, paths)
+    direct = tokens_per_second(direct_tokens, paths)
+    print("PlaintextCorpusReader: {:12,.0f} tokens/s".format(reader))
+    print("tokenize_file:         {:12,.0f} tokens/s".format(direct))
+    print("speedup:               {:12.1f}x".format(direct / reader))
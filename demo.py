@@ -7,7 +7,7 @@ from gensim.corpora.textcorpus import TextDirectoryCorpus
 from lexicon.music import Album
 from lexicon.music import english_stopwords
 from lexicon.music import stemmer
-from lexicon.tfidf import important_words
+from lexicon.tfidf import important_words, CorpusIndex
 
 
 albums = [Album('lyrics/kendrick/tpab.json'),
@@ -15,9 +15,10 @@ albums = [Album('lyrics/kendrick/tpab.json'),
           Album('lyrics/taylor/1989.json'),
           Album('lyrics/taylor/red.json')]
 
+index = CorpusIndex(albums)
 for album in albums:
     print("The most important words in " + album.title + " are:")
-    important = important_words(album, albums, 5)
+    important = important_words(album, index, 5)
     for term in important:
         print(term)
     print()
@@ -0,0 +1,155 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from lexicon.tfidf import document_term_matrix
+
+
+def log_normalize(joint):
+    """Turn rows of joint log probabilities into log probabilities
+    that sum to one, without leaving log space.
+    """
+
+    top = joint.max(axis=1, keepdims=True)
+    return joint - (top + np.log(np.exp(joint - top).sum(axis=1, keepdims=True)))
+
+
+class NaiveBayes:
+    """A Naive Bayes classifier over a fixed set of feature words that
+    trains and classifies whole batches of documents with array
+    operations on a sparse document-term matrix.
+
+    The 'bernoulli' model looks at which feature words a document
+    contains and which it lacks. With the default smoothing of 0.5 it
+    gives the same probabilities as `nltk.NaiveBayesClassifier` trained
+    on `{'contains(word)': bool}` feature sets. The 'multinomial' model
+    counts every occurrence of a feature word instead.
+
+    >>> documents = [['sea', 'fun'], ['sea', 'sea'], ['city', 'lights'], ['city', 'fun'], ['sea', 'city']]
+    >>> labels = ['beach', 'beach', 'town', 'town', 'town']
+    >>> classifier = NaiveBayes(['sea', 'city', 'fun']).fit(documents, labels)
+    >>> classifier.predict([['sea'], ['city', 'lights']])
+    ['beach', 'town']
+    >>> [format(p, '0.3f') for p in classifier.predict_proba([['fun']])[0]]
+    ['0.629', '0.371']
+    >>> classifier.show_most_informative_features(2)
+    Most Informative Features
+               contains(sea) = True            beach : town   =      2.2 : 1.0
+               contains(fun) = True            beach : town   =      1.3 : 1.0
+    >>> NaiveBayes(['sea', 'city'], model='multinomial', smoothing=1).fit(documents, labels).predict([['sea', 'city', 'sea']])
+    ['beach']
+    """
+
+    models = ('bernoulli', 'multinomial')
+
+    def __init__(self, features, model='bernoulli', smoothing=0.5):
+        if model not in self.models:
+            raise ValueError("model must be one of {}, not {!r}".format(self.models, model))
+        self.features = sorted(set(features))
+        self.vocabulary = {word: i for i, word in enumerate(self.features)}
+        self.model = model
+        self.smoothing = smoothing
+        self.labels = []
+
+    def matrix(self, documents):
+        return document_term_matrix(documents, self.vocabulary,
+                                    binary=self.model == 'bernoulli')
+
+    def fit(self, documents, labels):
+        """Train on documents and their labels, which can be any sortable values."""
+        X = self.matrix(documents)
+        self.labels = sorted(set(labels))
+        rows = [self.labels.index(label) for label in labels]
+        # one-hot labels turn per-label sums into a single product
+        Y = csr_matrix((np.ones(len(rows)), (rows, np.arange(len(rows)))),
+                       shape=(len(self.labels), len(rows)))
+        counts = np.asarray((Y @ X).todense())
+        documents_per_label = np.asarray(Y.sum(axis=1)).ravel()
+        a = self.smoothing
+
+        self.log_prior = np.log((documents_per_label + a) /
+                                (documents_per_label.sum() + a * len(self.labels)))
+        if self.model == 'bernoulli':
+            absent = documents_per_label[:, None] - counts
+            # like nltk, a feature only has as many values as were seen in training
+            bins = (counts.sum(axis=0) > 0).astype(float) + (absent.sum(axis=0) > 0)
+            denominator = documents_per_label[:, None] + a * bins
+            self.probabilities = ((counts + a) / denominator, (absent + a) / denominator)
+            self.observed = (counts > 0, absent > 0)
+            self.log_present = np.log(self.probabilities[0])
+            self.log_absent = np.log(self.probabilities[1])
+        else:
+            self.probabilities = ((counts + a) /
+                                  (counts.sum(axis=1, keepdims=True) + a * len(self.features)),)
+            self.observed = (counts > 0,)
+            self.log_present = np.log(self.probabilities[0])
+        return self
+
+    def predict_log_proba(self, documents):
+        """Return an array of log probabilities with a row per
+        document and a column per label, in the order of `labels`.
+        """
+
+        X = self.matrix(documents)
+        if self.model == 'bernoulli':
+            joint = (X @ (self.log_present - self.log_absent).T +
+                     self.log_absent.sum(axis=1) + self.log_prior)
+        else:
+            joint = X @ self.log_present.T + self.log_prior
+        return log_normalize(np.asarray(joint))
+
+    def predict_proba(self, documents):
+        return np.exp(self.predict_log_proba(documents))
+
+    def predict(self, documents):
+        """Return the most likely label of each document. An album
+        can be passed directly to classify all of its songs.
+        """
+
+        return [self.labels[i] for i in self.predict_log_proba(documents).argmax(axis=1)]
+
+    def accuracy(self, documents, labels):
+        predictions = self.predict(documents)
+        return sum(p == l for p, l in zip(predictions, labels)) / len(predictions)
+
+    def feature_values(self):
+        """Yield the name, value, per-label probabilities and
+        per-label observed flags of every feature value.
+        """
+
+        if self.model == 'bernoulli':
+            names, values = 'contains({})', (True, False)
+        else:
+            names, values = 'count({})', (1,)
+        for value, probabilities, observed in zip(values, self.probabilities, self.observed):
+            for i, word in enumerate(self.features):
+                yield names.format(word), value, probabilities[:, i], observed[:, i]
+
+    def most_informative_features(self, n=100):
+        """Return the `n` (feature, value) pairs whose probability differs
+        most between labels, ranked by the ratio of the largest to the
+        smallest probability among the labels they were seen with.
+        """
+
+        ranked = []
+        for name, value, probabilities, observed in self.feature_values():
+            seen = probabilities[observed]
+            if len(seen):
+                ratio = seen.min() / seen.max()
+                ranked.append((ratio, name, value is not None, str(value).lower(), value))
+        ranked.sort(key=lambda entry: entry[:4])
+        return [(name, value) for _, name, _, _, value in ranked[:n]]
+
+    def show_most_informative_features(self, n=10):
+        table = {(name, value): (probabilities, observed)
+                 for name, value, probabilities, observed in self.feature_values()}
+        print("Most Informative Features")
+        for name, value in self.most_informative_features(n):
+            probabilities, observed = table[name, value]
+            labels = sorted((i for i in range(len(self.labels)) if observed[i]),
+                            key=lambda i: (-probabilities[i], self.labels[i]), reverse=True)
+            if len(labels) == 1:
+                continue
+            l0, l1 = labels[0], labels[-1]
+            ratio = "%8.1f" % (probabilities[l1] / probabilities[l0])
+            print("%24s = %-14r %6s : %-6s = %s : 1.0"
+                  % (name, value, str(self.labels[l1])[:6], str(self.labels[l0])[:6], ratio))
@@ -0,0 +1,168 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import tempfile
+from array import array
+
+# bump when the layout of cache entries changes
+VERSION = 1
+MAGIC = b'LEXICON-TOKENS\n'
+
+default_directory = os.path.join(os.path.expanduser('~'), '.cache', 'lexicon')
+
+# the umask can only be read by setting it, so read it once
+umask = os.umask(0)
+os.umask(umask)
+
+def write_atomically(path, data):
+    """Write text or bytes to a file, replacing it at once so that
+    readers never see half a file. The file gets the permissions
+    that `open` would give it.
+
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'entry')
+    >>> write_atomically(path, 'a')
+    >>> write_atomically(path, b'b')
+    >>> open(path).read(), oct(os.stat(path).st_mode & 0o777) == oct(0o666 & ~umask)
+    ('b', True)
+    """
+
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+        # mkstemp only lets the owner read the file
+        os.chmod(temporary, 0o666 & ~umask)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+def content_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+class TokenCache:
+    """An on-disk cache of the normalized words of text files.
+
+    Entries are keyed by the path of the file and the settings used
+    to tokenize and normalize it. An entry is reused while the file
+    keeps its modification time and size, or, failing that, while its
+    content hash is unchanged. Words are stored once in a table and
+    the token stream as an array of positions into that table.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> path = os.path.join(directory, 'song.txt')
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('la di la')
+    >>> cache = TokenCache(os.path.join(directory, 'cache'))
+    >>> cache.load(path, {'stem': False}) is None
+    True
+    >>> cache.store(path, {'stem': False}, ['la', 'di', 'la'])
+    >>> cache.load(path, {'stem': False})
+    ['la', 'di', 'la']
+    >>> cache.load(path, {'stem': True}) is None
+    True
+    >>> with open(path, 'w') as f:
+    ...     _ = f.write('da')
+    >>> cache.load(path, {'stem': False}) is None
+    True
+    >>> TokenCache(os.path.join(path, 'cache')).store(path, {'stem': False}, ['da'])
+    """
+
+    def __init__(self, directory=default_directory):
+        self.directory = directory
+
+    def entry(self, path, settings):
+        """Return the file that caches a path under some settings."""
+        key = json.dumps([VERSION, os.path.abspath(path), settings], sort_keys=True)
+        name = hashlib.sha1(key.encode('utf8')).hexdigest()
+        return os.path.join(self.directory, name[:2], name + '.tok')
+
+    def load(self, path, settings):
+        """Return the cached words of a file, or None
+        if there is no entry or the file has changed.
+        """
+
+        try:
+            with open(self.entry(path, settings), 'rb') as f:
+                if f.readline() != MAGIC:
+                    return None
+                header = json.loads(f.readline())
+                table = f.read(header['table']).decode('utf8')
+                positions = array('I')
+                positions.frombytes(f.read())
+        except (OSError, ValueError, KeyError):
+            return None
+        if header['byteorder'] != sys.byteorder:
+            positions.byteswap()
+
+        table = table.split('\n') if table else []
+        words = [table[p] for p in positions]
+        stat = os.stat(path)
+        if (header['mtime'], header['size']) != (stat.st_mtime_ns, stat.st_size):
+            digest = content_hash(path)
+            if header['size'] != stat.st_size or header['hash'] != digest:
+                return None
+            # the file was only touched, remember its new time
+            self.store(path, settings, words, digest)
+        return words
+
+    def store(self, path, settings, words, digest=None):
+        """Cache the words of a file under some settings. The cache
+        is only an aid, so a directory that cannot be written to,
+        or a full disk, leaves the file uncached instead of failing.
+        """
+
+        try:
+            self.write(path, settings, words, digest)
+        except OSError:
+            pass
+
+    def write(self, path, settings, words, digest=None):
+        stat = os.stat(path)
+        table, positions = {}, array('I')
+        for word in words:
+            positions.append(table.setdefault(word, len(table)))
+        table = '\n'.join(table).encode('utf8')
+        header = {'mtime': stat.st_mtime_ns,
+                  'size': stat.st_size,
+                  'hash': digest or content_hash(path),
+                  'byteorder': sys.byteorder,
+                  'table': len(table)}
+
+        entry = self.entry(path, settings)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        write_atomically(entry, b''.join([MAGIC, json.dumps(header).encode('utf8') + b'\n',
+                                          table, positions.tobytes()]))
+
+    def clear(self):
+        """Delete every entry and return how many there were."""
+        removed = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.tok'):
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+if __name__ == '__main__':
+    """
+    $ python -m lexicon.cache clear
+    $ python -m lexicon.cache rebuild lyrics/kendrick/damn.json lyrics/taylor/red.json
+    """
+    parser = argparse.ArgumentParser(description='Manage the token cache of lyrics files.')
+    parser.add_argument('command', choices=['clear', 'rebuild'])
+    parser.add_argument('album_files', nargs='*')
+    args = parser.parse_args()
+
+    from lexicon import music
+    cache = music.token_cache or TokenCache()
+    print("Removed {} cache entries from {}".format(cache.clear(), cache.directory))
+    if args.command == 'rebuild':
+        for album_file in args.album_files:
+            album = music.Album(album_file)
+            print("Cached {} songs of {}".format(len(album), album.title))
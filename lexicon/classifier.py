@@ -1,13 +1,13 @@
-import nltk
 import random
 from lexicon.music import Album, Song
-from lexicon.tfidf import important_words
+from lexicon.tfidf import TfidfVectorizer
+from lexicon.bayes import NaiveBayes
 
 albums = [Album('lyrics/kendrick/damn.json'),
           Album('lyrics/taylor/red.json'),
           Album('lyrics/taylor/1989.json'),
           Album('lyrics/kendrick/tpab.json')]
-documents = [(song.words, album.artist) for album in albums for song in album]
+documents = [(song, album.artist) for album in albums for song in album]
 random.shuffle(documents)
 
 # all_words = sum([album.fdist for album in albums], nltk.FreqDist())
@@ -16,55 +16,38 @@ random.shuffle(documents)
 # collect the n most important words from each song
 # `important_words` is based on highest tfidf score
 all_songs = [song for album in albums for song in album]
+vectorizer = TfidfVectorizer()
 word_features = set()
-for album in albums:
-    for song in album:
-        imp_words = important_words(song, all_songs, n=10)
-        word_features.update([t.word for t in imp_words])
-
-def document_features(document):
-    """Returns a dictionary mapping 
-    string features names to features.
-
-    Keyword arguments:
-    document -- a list of words
-    """
-    document_words = set(document)
-    features = dict()
-    for word in word_features:
-        features['contains({})'.format(word)] = word in document_words
-    return features
-
-feature_sets = [(document_features(d), c) for (d, c) in documents]
-
-def predict_song(test_song, classifier):
-    print("The classifier predicts {} to be similar to".format(test_song.title))
-    test_set = document_features(test_song.words)
-    prediction = classifier.classify(test_set)
-    print(prediction)
-    print("with probability")
-    prob_dist = classifier.prob_classify(test_set)
-    print(prob_dist.prob(prediction))
+for imp_words in vectorizer.important_words(vectorizer.fit_transform(all_songs), n=10):
+    word_features.update([t.word for t in imp_words])
+
+def predict_album(album, classifier):
+    """Classify every song of an album in one batch."""
+    predictions = classifier.predict(album)
+    probabilities = classifier.predict_proba(album).max(axis=1)
+    for song, prediction, probability in zip(album, predictions, probabilities):
+        print("The classifier predicts {} to be similar to".format(song.title))
+        print(prediction)
+        print("with probability")
+        print(probability)
+        print()
 
 def naive_bayes(train_set, validation_set):
-    classifier = nltk.NaiveBayesClassifier.train(train_set)
-    # print(classifier.classify(document_features(['yah'])))
+    classifier = NaiveBayes(word_features).fit(*zip(*train_set))
     print("The Naive Bayes classifier correctly classifies the validation set with accuracy")
-    print(nltk.classify.accuracy(classifier, validation_set))
+    print(classifier.accuracy(*zip(*validation_set)))
     classifier.show_most_informative_features(10)
 
     # the algorithm predicts that this Vince Staples song is 
     # most similar to Kendrick Lamar's songs
     test_song = Song('lyrics/vince/summertime06/08.txt', title='SAMO')
-    predict_song(test_song, classifier)
+    predict_album([test_song], classifier)
 
     bft = Album('lyrics/vince/bigfishtheory.json')
-    for song in bft:
-        predict_song(song, classifier)
-        print()
+    predict_album(bft, classifier)
 
 
 if __name__ == '__main__':
-    split = int(len(feature_sets) / 3)
-    train_set, validation_set = feature_sets[split:], feature_sets[:split]
+    split = int(len(documents) / 3)
+    train_set, validation_set = documents[split:], documents[:split]
     naive_bayes(train_set, validation_set)
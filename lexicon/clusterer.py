@@ -1,8 +1,13 @@
 import random
+from itertools import islice
 from statistics import mean
 
+import numpy as np
+from scipy.sparse import csr_matrix, issparse, vstack
+
+from lexicon import instrument
 from lexicon.music import Album, Song
-from lexicon.tfidf import tfidf, important_words, Term
+from lexicon.tfidf import TfidfVectorizer
 
 
 class HashableDict(dict):
@@ -49,16 +54,118 @@ class WordScoreVector(HashableDict):
         return self.name == other.name
 
 
+def sq_distances(X, centroids):
+    """Return the matrix of squared Euclidean distances between
+    every row of X, dense or sparse, and every centroid.
+
+    >>> X = np.array([[5.0, 9.0], [3.0, 8.0]])
+    >>> sq_distances(X, np.array([[3.0, 8.0]])).tolist()
+    [[5.0], [0.0]]
+    """
+
+    if issparse(X):
+        row_norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    else:
+        row_norms = np.einsum('ij,ij->i', X, X)
+    distances = np.asarray(X @ centroids.T) * -2
+    distances += row_norms[:, np.newaxis]
+    distances += np.einsum('ij,ij->i', centroids, centroids)
+    # rounding can leave tiny negative distances
+    return np.maximum(distances, 0, out=distances)
+
+def cluster_sums(X, labels, k):
+    """Return the sum of the rows of X assigned to each of
+    k clusters and the number of rows in each cluster.
+    """
+
+    counts = np.bincount(labels, minlength=k)
+    members = csr_matrix((np.ones(len(labels)), (labels, np.arange(len(labels)))),
+                         shape=(k, X.shape[0]))
+    sums = members @ X
+    if issparse(sums):
+        sums = sums.toarray()
+    return sums, counts
+
+def cluster_means(X, labels, centroids):
+    """Return the mean of the rows of X assigned to each centroid.
+    A centroid without any rows assigned to it stays in place.
+    """
+
+    sums, counts = cluster_sums(X, labels, len(centroids))
+    means = centroids.copy()
+    nonempty = counts > 0
+    means[nonempty] = sums[nonempty] / counts[nonempty, np.newaxis]
+    return means
+
+def own_sq_distances(X, centroids, labels):
+    """Return the squared distance between every row of X
+    and the centroid it is labelled with.
+    """
+
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    if issparse(X):
+        X = csr_matrix(X)
+        row_norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+        # only the stored entries of each row contribute to its product
+        # with its centroid, so the centroids are never gathered per row
+        rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+        products = np.bincount(rows, X.data * centroids[labels[rows], X.indices],
+                               minlength=X.shape[0])
+    else:
+        row_norms = np.einsum('ij,ij->i', X, X)
+        products = np.einsum('ij,ij->i', X, centroids[labels])
+    distances = row_norms - 2 * products + centroid_norms[labels]
+    return np.maximum(distances, 0, out=distances)
+
+def k_means_plus_plus(X, k, rng):
+    """Return k rows of X as initial centroids, each chosen with
+    probability proportional to its squared distance from the
+    centroids chosen before it.
+    """
+
+    def row(i):
+        return X[i].toarray().ravel() if issparse(X) else np.array(X[i], dtype=float)
+
+    n = X.shape[0]
+    centroids = [row(rng.integers(n))]
+    closest = sq_distances(X, np.array(centroids)).ravel()
+    for _ in range(1, k):
+        total = closest.sum()
+        if total > 0:
+            i = rng.choice(n, p=closest / total)
+        else:
+            i = rng.integers(n)
+        centroids.append(row(i))
+        closest = np.minimum(closest, sq_distances(X, centroids[-1][np.newaxis]).ravel())
+    return np.array(centroids)
+
+
 class Clusterer:
     """Uses Lloyd's algorithm to cluster vectors
     of words and associated numbers, such as tf-idf scores.
 
+    Vectors are either dictionaries over `vocab`, clustered
+    with `k_means`, or rows of a dense or sparse matrix,
+    clustered with `fit`.
+
+    `algorithm` is 'lloyd', which compares every vector with every
+    centroid in each iteration, or 'hamerly', which keeps bounds on
+    the distances of each vector to skip most of those comparisons
+    and is worth it for large k. Both give the same clusters.
+    After a call to `fit`, `distance_evaluations` and
+    `skipped_evaluations` count the vector-to-centroid distances
+    that were computed and skipped.
+
     >>> vocab = {'a', 'b'}
     >>> c = Clusterer(vocab)
     """
 
-    def __init__(self, vocab):
+    def __init__(self, vocab=(), algorithm='lloyd'):
+        assert algorithm in ('lloyd', 'hamerly'), 'Unknown algorithm'
         self.vocab = set(vocab)
+        self.algorithm = algorithm
+        self.distance_evaluations = 0
+        self.skipped_evaluations = 0
 
     def sq_dist(self, vec0, vec1):
         """Return the squared Euclidean distance between two
@@ -88,8 +195,6 @@ class Clusterer:
         """Return a list of clusters, each of which is a list
         of vectors that are closest to the same centroid.
 
-        TODO: worry about speed + correctness
-
         >>> c = Clusterer({'a', 'b'})
         >>> vec0 = {'a': 5.0, 'b': 9.0}
         >>> vec1 = {'a': 3.0, 'b': 8.0}
@@ -105,15 +210,11 @@ class Clusterer:
         True
         """
 
-        closest = []
+        clusters = [[] for _ in centroids]
         for vec in vecs:
-            closest.append((vec, self.find_closest(vec, centroids)))
-        return [[vec for vec, centroid in closest if centroid == c] for c in centroids]
-        clusters = []
-        for vec, centroid in closest:
-            if centroid not in clusters:
-                clusters[centroid] = set()
-            clusters[centroid].add(vec)
+            closest = min(range(len(centroids)),
+                          key=lambda i: self.sq_dist(vec, centroids[i]))
+            clusters[closest].append(vec)
         return clusters
 
     def find_centroid(self, cluster):
@@ -134,10 +235,155 @@ class Clusterer:
             centroid[word] = mean([vec[word] for vec in cluster])
         return centroid
 
+    def fit(self, X, k, iterations=100, tol=1e-4, init='k-means++', seed=None):
+        """Use k-means to group the rows of a dense or sparse
+        matrix into k clusters. Returns the centroids as a k-row
+        array and the index of the centroid closest to each row.
+
+        Stops early once no row changes cluster or the total squared
+        movement of the centroids is at most `tol`. `init` is either
+        'k-means++' or 'random'.
+
+        >>> c = Clusterer()
+        >>> X = np.array([[5.0, 9.0], [3.0, 9.0], [4.0, 3.0], [4.0, 2.0]])
+        >>> centroids, labels = c.fit(X, 2, seed=0)
+        >>> labels = labels.tolist()
+        >>> labels[0] == labels[1], labels[1] == labels[2], labels[2] == labels[3]
+        (True, False, True)
+        >>> centroids[labels[2]].tolist()
+        [4.0, 2.5]
+        """
+
+        n = X.shape[0]
+        assert n >= k, 'Not enough vectors to cluster'
+        rng = np.random.default_rng(seed)
+        with instrument.span('clusterer.init'):
+            if init == 'k-means++':
+                centroids = k_means_plus_plus(X, k, rng)
+            else:
+                rows = rng.choice(n, k, replace=False)
+                centroids = X[rows].toarray() if issparse(X) else np.array(X[rows], dtype=float)
+
+        self.distance_evaluations = 0
+        self.skipped_evaluations = 0
+        with instrument.span('clusterer.fit'):
+            if self.algorithm == 'hamerly':
+                centroids, labels = self.hamerly(X, centroids, iterations, tol)
+            else:
+                centroids, labels = self.lloyd(X, centroids, iterations, tol)
+        instrument.count('clusterer.distance_evaluations', self.distance_evaluations)
+        instrument.count('clusterer.skipped_evaluations', self.skipped_evaluations)
+        return centroids, labels
+
+    def lloyd(self, X, centroids, iterations, tol):
+        """Run Lloyd's iterations from the given centroids,
+        comparing every vector with every centroid each time.
+        """
+
+        n, k = X.shape[0], len(centroids)
+        labels = None
+        for _ in range(iterations):
+            instrument.count('clusterer.iterations')
+            new_labels = sq_distances(X, centroids).argmin(axis=1)
+            self.distance_evaluations += n * k
+            if labels is not None and np.array_equal(labels, new_labels):
+                break
+            labels = new_labels
+            new_centroids = cluster_means(X, labels, centroids)
+            shift = ((new_centroids - centroids) ** 2).sum()
+            centroids = new_centroids
+            if shift <= tol:
+                break
+        # assign once more so that labels agree with the final centroids
+        labels = sq_distances(X, centroids).argmin(axis=1)
+        self.distance_evaluations += n * k
+        return centroids, labels
+
+    def hamerly(self, X, centroids, iterations, tol):
+        """Run Lloyd's iterations from the given centroids using
+        Hamerly's bounds. Each vector keeps an upper bound on the
+        distance to its own centroid and a lower bound on the distance
+        to every other centroid; a vector whose upper bound is below
+        both its lower bound and half the distance from its centroid
+        to the nearest other centroid cannot change cluster.
+
+        >>> X = np.array([[0.0], [1.0], [10.0], [11.0], [20.0], [21.0]])
+        >>> lloyd, hamerly = Clusterer(), Clusterer(algorithm='hamerly')
+        >>> _, labels = lloyd.fit(X, 3, seed=1)
+        >>> _, accelerated = hamerly.fit(X, 3, seed=1)
+        >>> labels.tolist() == accelerated.tolist()
+        True
+        >>> hamerly.distance_evaluations < lloyd.distance_evaluations
+        True
+
+        Every distance of every pass is either evaluated or skipped,
+        even when almost every vector has to be looked at again.
+
+        >>> from scipy.sparse import random as sparse_random
+        >>> X = sparse_random(300, 50, density=0.3, random_state=24, format='csr')
+        >>> with instrument.recording() as recorded:
+        ...     _ = hamerly.fit(X, 6, seed=0)
+        >>> passes = recorded['counters']['clusterer.iterations'] + 1
+        >>> hamerly.distance_evaluations + hamerly.skipped_evaluations == passes * 300 * 6
+        True
+        >>> 0 <= hamerly.skipped_evaluations
+        True
+        """
+
+        n, k = X.shape[0], len(centroids)
+        rows = np.arange(n)
+        distances = np.sqrt(sq_distances(X, centroids))
+        self.distance_evaluations += n * k
+        labels = distances.argmin(axis=1)
+        upper = distances[rows, labels]
+        distances[rows, labels] = np.inf
+        lower = distances.min(axis=1)
+
+        for _ in range(iterations):
+            instrument.count('clusterer.iterations')
+            new_centroids = cluster_means(X, labels, centroids)
+            moved = np.sqrt(((new_centroids - centroids) ** 2).sum(axis=1))
+            centroids = new_centroids
+
+            # moving centroids loosen the bounds by at most how far they moved
+            upper += moved[labels]
+            if k > 1:
+                farthest, second = np.argsort(moved)[::-1][:2]
+                lower -= np.where(labels == farthest, moved[second], moved[farthest])
+
+            between = np.sqrt(sq_distances(centroids, centroids))
+            np.fill_diagonal(between, np.inf)
+            bound = np.maximum(between.min(axis=1)[labels] / 2, lower)
+
+            candidates = np.flatnonzero(upper > bound)
+            upper[candidates] = np.sqrt(own_sq_distances(X[candidates], centroids,
+                                                         labels[candidates]))
+            evaluations = len(candidates)
+            candidates = candidates[upper[candidates] > bound[candidates]]
+            distances = np.sqrt(sq_distances(X[candidates], centroids))
+            # the distance to the own centroid was just tightened above,
+            # so only the other k - 1 are new
+            evaluations += len(candidates) * (k - 1)
+            self.distance_evaluations += evaluations
+            self.skipped_evaluations += n * k - evaluations
+
+            new_labels = distances.argmin(axis=1)
+            changed = np.any(new_labels != labels[candidates])
+            labels[candidates] = new_labels
+            upper[candidates] = distances[np.arange(len(candidates)), new_labels]
+            distances[np.arange(len(candidates)), new_labels] = np.inf
+            lower[candidates] = distances.min(axis=1)
+            if not changed or (moved ** 2).sum() <= tol:
+                break
+        return centroids, labels
+
     def k_means(self, vecs, k, iterations=100):
         """Use k-means to group vectors into k clusters.
         Returns the centroids and their corresponding clusters.
 
+        The vectors are clustered as rows of a matrix with `fit`,
+        seeded from the `random` module.
+
         >>> c = Clusterer({'a', 'b'})
         >>> vec0 = {'a': 5.0, 'b': 9.0}
         >>> vec1 = {'a': 3.0, 'b': 9.0}
@@ -150,14 +396,91 @@ class Clusterer:
         """
         assert len(vecs) >= k, 'Not enough vectors to cluster'
 
-        # select initial centroids randomly
-        centroids = [vec for vec in random.sample(vecs, k)]
-
-        for _ in range(iterations):
-            clusters = self.group_by_centroid(vecs, centroids)
-            centroids = [self.find_centroid(cluster) for cluster in clusters]
+        words = sorted(self.vocab)
+        X = np.array([[vec[w] for w in words] for vec in vecs], dtype=float)
+        X = X.reshape(len(vecs), len(words))
+        centroids, labels = self.fit(X, k, iterations=iterations,
+                                     seed=random.randrange(2 ** 32))
+        clusters = [[] for _ in range(k)]
+        for vec, label in zip(vecs, labels.tolist()):
+            clusters[label].append(vec)
+        centroids = [dict(zip(words, centroid)) for centroid in centroids.tolist()]
         return centroids, clusters
 
+class MiniBatchKMeans:
+    """Uses mini-batch k-means to cluster a stream of vectors
+    that need not fit in memory at once. Vectors are consumed
+    `batch_size` at a time and each centroid moves towards
+    the mean of every vector ever assigned to it.
+
+    Vectors are dictionaries over `vocab` if it is given,
+    otherwise arrays or rows of sparse matrices.
+
+    >>> def stream():
+    ...     for i in range(1000):
+    ...         yield {'a': float(i % 2), 'b': float(i % 2)}
+    >>> mbk = MiniBatchKMeans(2, batch_size=100, vocab={'a', 'b'}, seed=0)
+    >>> mbk = mbk.fit(stream())
+    >>> sorted(mbk.centroids.tolist())
+    [[0.0, 0.0], [1.0, 1.0]]
+    >>> mbk.counts.tolist()
+    [500, 500]
+    >>> label = mbk.predict([{'a': 0.9, 'b': 1.2}])[0]
+    >>> mbk.centroids[label].tolist()
+    [1.0, 1.0]
+    """
+
+    def __init__(self, k, batch_size=100, vocab=None, seed=None):
+        self.k = k
+        self.batch_size = batch_size
+        self.words = sorted(vocab) if vocab is not None else None
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.counts = np.zeros(k, dtype=np.int64)
+
+    def matrix(self, batch):
+        """Return a batch of vectors as the rows of a matrix."""
+        if self.words is not None:
+            return np.array([[vec[w] for w in self.words] for vec in batch], dtype=float)
+        if issparse(batch):
+            return batch.tocsr()
+        if issparse(batch[0]):
+            return vstack(batch, format='csr')
+        return np.array(batch, dtype=float)
+
+    def partial_fit(self, batch):
+        """Update the centroids with one batch of vectors.
+        The first batch must hold at least k vectors.
+        """
+
+        instrument.count('clusterer.batches')
+        X = self.matrix(batch)
+        if self.centroids is None:
+            assert X.shape[0] >= self.k, 'Not enough vectors to cluster'
+            self.centroids = k_means_plus_plus(X, self.k, self.rng)
+        labels = sq_distances(X, self.centroids).argmin(axis=1)
+        sums, counts = cluster_sums(X, labels, self.k)
+        self.counts += counts
+        updated = counts > 0
+        # a learning rate of 1 / count keeps each centroid
+        # at the running mean of the vectors assigned to it
+        step = sums[updated] - counts[updated, np.newaxis] * self.centroids[updated]
+        self.centroids[updated] += step / self.counts[updated, np.newaxis]
+        return self
+
+    def fit(self, vectors):
+        """Update the centroids with every vector of an iterable."""
+        vectors = iter(vectors)
+        while True:
+            batch = list(islice(vectors, self.batch_size))
+            if not batch:
+                return self
+            self.partial_fit(batch)
+
+    def predict(self, batch):
+        """Return the index of the closest centroid for each vector."""
+        return sq_distances(self.matrix(batch), self.centroids).argmin(axis=1)
+
 if __name__ == '__main__':
     albums = [Album('lyrics/kendrick/damn.json'),
               Album('lyrics/taylor/red.json')]
@@ -165,18 +488,18 @@ if __name__ == '__main__':
     # collect the n most important words from each song
     # `important_words` is based on highest tfidf score
     all_songs = [song for album in albums for song in album]
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(all_songs)
     word_features = set()
-    for song in all_songs:
-        imp_words = important_words(song, all_songs, n=2)
+    for imp_words in vectorizer.important_words(matrix, n=2):
         word_features.update([t.word for t in imp_words])
 
+    word_features = sorted(word_features)
+    columns = [vectorizer.vocabulary[word] for word in word_features]
+    scores = matrix[:, columns].toarray().tolist()
     clusterer = Clusterer(word_features)
-    wsvecs = []
-    for song in all_songs:
-        terms = []
-        for word in word_features:
-            terms.append(Term(word=word, score=tfidf(word, song, all_songs)))
-        wsvecs.append(WordScoreVector(song.title, terms))
+    wsvecs = [WordScoreVector(song.title, zip(word_features, row))
+              for song, row in zip(all_songs, scores)]
 
     centroids, clusters = clusterer.k_means(wsvecs, 4)
     for cluster in clusters:
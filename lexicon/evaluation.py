@@ -0,0 +1,151 @@
+import os
+import time
+import random
+import argparse
+from statistics import mean, pstdev
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from lexicon.bayes import NaiveBayes
+from lexicon.tfidf import TfidfVectorizer
+
+Fold = namedtuple('Fold', ['fold', 'features', 'accuracy', 'train_size', 'test_size',
+                           'select_seconds', 'train_seconds', 'test_seconds'])
+
+def stratified_folds(labels, k, seed=None):
+    """Split the positions of `labels` into `k` folds in which every
+    label is about as common as it is overall.
+
+    >>> labels = ['a'] * 6 + ['b'] * 3
+    >>> folds = stratified_folds(labels, 3, seed=0)
+    >>> [''.join(sorted(labels[i] for i in fold)) for fold in folds]
+    ['aab', 'aab', 'aab']
+    >>> sorted(i for fold in folds for i in fold) == list(range(9))
+    True
+    """
+
+    rng = random.Random(seed)
+    by_label = {}
+    for i, label in enumerate(labels):
+        by_label.setdefault(label, []).append(i)
+    folds = [[] for _ in range(k)]
+    # deal each label out in turn, continuing where the last label stopped
+    # so that folds end up with nearly equal sizes
+    position = 0
+    for label in sorted(by_label):
+        indices = by_label[label]
+        rng.shuffle(indices)
+        for i in indices:
+            folds[position % k].append(i)
+            position += 1
+    return folds
+
+def select_features(documents, n):
+    """Return the `n` words with the highest tf-idf score in each
+    document, scored against the documents themselves.
+    """
+
+    vectorizer = TfidfVectorizer()
+    features = set()
+    for terms in vectorizer.important_words(vectorizer.fit_transform(documents), n=n):
+        features.update(term.word for term in terms)
+    return features
+
+def run_fold(documents, labels, fold, test, n, model='bernoulli'):
+    """Select features from and train on every document outside of
+    `test`, then return how well the held out documents are classified.
+    """
+
+    held_out = set(test)
+    train = [i for i in range(len(documents)) if i not in held_out]
+    train_documents = [documents[i] for i in train]
+
+    start = time.perf_counter()
+    features = select_features(train_documents, n)
+    selected = time.perf_counter()
+    classifier = NaiveBayes(features, model=model).fit(train_documents,
+                                                       [labels[i] for i in train])
+    trained = time.perf_counter()
+    accuracy = classifier.accuracy([documents[i] for i in test], [labels[i] for i in test])
+    tested = time.perf_counter()
+    return Fold(fold, len(classifier.features), accuracy, len(train), len(test),
+                selected - start, trained - selected, tested - trained)
+
+# the corpus of a worker process, sent once when the worker starts
+# rather than with every fold
+_corpus = None
+
+def _share(documents, labels):
+    global _corpus
+    _corpus = (documents, labels)
+
+def _run_shared(fold, test, n, model):
+    return run_fold(*_corpus, fold, test, n, model)
+
+def cross_validate(documents, labels, k=5, n=10, model='bernoulli', processes=None, seed=None):
+    """Return a `Fold` for each of `k` stratified folds. Features are
+    the `n` most important words of each training document, so no fold
+    sees its held out documents before it is tested. Folds are run in
+    parallel by `processes` worker processes, one per core by default.
+
+    >>> from lexicon.music import TextCollection
+    >>> documents = [TextCollection(words.split()) for words in
+    ...              ['sea sun fun', 'sea sand', 'sun sea', 'sea wave',
+    ...               'city lights', 'city cars fun', 'lights cars', 'city night']]
+    >>> labels = ['beach'] * 4 + ['town'] * 4
+    >>> folds = cross_validate(documents, labels, k=2, n=2, processes=1, seed=0)
+    >>> [(fold.train_size, fold.test_size, fold.accuracy) for fold in folds]
+    [(4, 4, 1.0), (4, 4, 1.0)]
+    """
+
+    folds = stratified_folds(labels, k, seed)
+    processes = processes or os.cpu_count()
+    if processes == 1:
+        return [run_fold(documents, labels, fold, test, n, model)
+                for fold, test in enumerate(folds)]
+    with ProcessPoolExecutor(min(processes, k), initializer=_share,
+                             initargs=(documents, labels)) as executor:
+        futures = [executor.submit(_run_shared, fold, test, n, model)
+                   for fold, test in enumerate(folds)]
+        return [future.result() for future in futures]
+
+def report(folds, n=None):
+    """Print the accuracy and timing of each fold and their means."""
+    if n is not None:
+        print("{} important words per song".format(n))
+    print("{:>4} {:>8} {:>8} {:>8} {:>8} {:>8}".format(
+        'fold', 'features', 'accuracy', 'select', 'train', 'test'))
+    for fold in folds:
+        print("{:>4} {:>8} {:>8.3f} {:>7.2f}s {:>7.2f}s {:>7.2f}s".format(
+            fold.fold, fold.features, fold.accuracy,
+            fold.select_seconds, fold.train_seconds, fold.test_seconds))
+    accuracies = [fold.accuracy for fold in folds]
+    print("accuracy {:.3f} +/- {:.3f}".format(mean(accuracies), pstdev(accuracies)))
+
+if __name__ == '__main__':
+    """
+    $ python -m lexicon.evaluation lyrics/ --folds 5 --features 5 10 20
+    """
+    parser = argparse.ArgumentParser(description='Cross-validate the artist classifier.')
+    parser.add_argument('root', help='directory of albums, as for Library')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--features', type=int, nargs='+', default=[10],
+                        help='numbers of important words to select from each song')
+    parser.add_argument('--model', choices=NaiveBayes.models, default='bernoulli')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    from lexicon.music import Library
+    library = Library(args.root, processes=args.processes)
+    documents, labels = [], []
+    for artist in library.artists:
+        for song in artist.songs():
+            documents.append(song)
+            labels.append(artist.name)
+    print("{} songs by {} artists".format(len(documents), len(library.artists)))
+
+    for n in args.features:
+        print()
+        report(cross_validate(documents, labels, args.folds, n, args.model,
+                              args.processes, args.seed), n)
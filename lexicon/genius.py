@@ -3,80 +3,470 @@ import json
 import os
 import sys
 import re
+import time
+import hashlib
+import asyncio
+import argparse
+import aiohttp
+from html.parser import HTMLParser
 from bs4 import BeautifulSoup
 
+from lexicon.cache import default_directory, write_atomically
+from lexicon.music import parse_album_file
+
 base_url = 'https://api.genius.com'
 search_url = base_url + '/search'
+web_url = 'https://genius.com'
+
+class LyricsNotFound(ValueError):
+    """Raised when a page has no lyrics div."""
+
+class LyricsParser(HTMLParser):
+    """Collects the text of the first `div` with the class `lyrics`,
+    leaving out scripts and styles, and ignores everything after
+    that div closes.
+    """
+
+    skipped = {'script', 'style'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.depth = 0
+        self.skipping = 0
+        self.done = False
+        self.text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self.depth:
+            if tag == 'div':
+                self.depth += 1
+            elif tag in self.skipped:
+                self.skipping += 1
+        elif tag == 'div' and 'lyrics' in (dict(attrs).get('class') or '').split():
+            self.depth = 1
+
+    def handle_endtag(self, tag):
+        if self.done or not self.depth:
+            return
+        if tag in self.skipped and self.skipping:
+            self.skipping -= 1
+        elif tag == 'div':
+            self.depth -= 1
+            self.done = self.depth == 0
+
+    def handle_data(self, data):
+        if self.depth and not self.skipping and not self.done:
+            self.text.append(data)
 
-def lyrics_from_song_api_path(song_api_path):
-    """Return a list of cleaned lyrics.
+def stream_lyrics(html, chunk_size=1 << 14):
+    """Return the lyrics text of a page, parsing it in chunks
+    and stopping as soon as the lyrics div closes.
+    """
+
+    parser = LyricsParser()
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        if parser.done:
+            break
+    if not parser.done and not parser.depth:
+        raise LyricsNotFound('The page has no lyrics')
+    return ''.join(parser.text)
+
+def soup_lyrics(html):
+    """Return the lyrics text of a page using BeautifulSoup."""
+    html = BeautifulSoup(html, 'html.parser')
+    [h.extract() for h in html(['script', 'style'])]
+    lyrics = html.find('div', {'class': 'lyrics'})
+    if lyrics is None:
+        raise LyricsNotFound('The page has no lyrics')
+    return lyrics.get_text()
+
+parsers = {'soup': soup_lyrics, 'stream': stream_lyrics}
+
+def extract_lyrics(html, parser='soup'):
+    """Return the cleaned lyrics from the html of a lyrics page.
+    `parser` is 'soup', which builds the whole page with
+    BeautifulSoup, or 'stream', which stops reading the page
+    once the lyrics are over.
 
     genius.com includes section headings, which I
     remove because they should not be included
-    in the lyrics.
+    in the lyrics. Raises `LyricsNotFound` if the
+    page has no lyrics div.
+
+    >>> page = ('<div class="lyrics">\\n[Verse 1]\\nSit down<script>x</script>'
+    ...         '<style>.a {}</style></div><p>more</p>')
+    >>> extract_lyrics(page)
+    '\\nSit down'
+    >>> extract_lyrics(page, parser='stream')
+    '\\nSit down'
+    >>> extract_lyrics('<p>Not found</p>', parser='stream')
+    Traceback (most recent call last):
+    ...
+    lexicon.genius.LyricsNotFound: The page has no lyrics
     """
 
+    lyrics = parsers[parser](html)
+    # this regex matches with all text enclosed by square brackets
+    return re.sub(r'\n\[[^\]]*\]', '', lyrics)
+
+def lyrics_from_song_api_path(song_api_path, parser='soup'):
+    """Return a list of cleaned lyrics."""
     song_url = base_url + song_api_path
     response = requests.get(song_url, headers=headers)
     json = response.json()
     path = json['response']['song']['path']
-    page_url = 'https://genius.com' + path
+    page_url = web_url + path
     page = requests.get(page_url)
-    html = BeautifulSoup(page.text, 'html.parser')
-    [h.extract() for h in html('script')]
-    lyrics = html.find('div', {'class': 'lyrics'}).get_text()
-    # this regex matches with all text enclosed by square brackets
-    return re.sub(r'\n\[[^\]]*\]', '', lyrics)
+    return extract_lyrics(page.text, parser)
+
+def find_song_api_path(search_response, artist_name):
+    """Return the api path of the first search hit by the artist, or None."""
+    for hit in search_response['response']['hits']:
+        if hit['result']['primary_artist']['name'] == artist_name:
+            return hit['result']['api_path']
+    return None
+
+def write_lyrics(path, song_title, lyrics):
+    write_atomically(path, song_title + '\n' + lyrics)
+
+def lyrics_path(target_directory, i):
+    # file name 00.txt, 01.txt, and so on
+    return os.path.join(target_directory, "%02d" % (i,) + '.txt')
+
+class RetryError(Exception):
+    pass
+
+class ResponseCache:
+    """An on-disk cache of JSON API responses keyed by the
+    url and parameters of the request. Entries older than
+    `max_age` seconds are ignored if it is given.
+
+    >>> import tempfile
+    >>> cache = ResponseCache(tempfile.mkdtemp())
+    >>> cache.load('/search', {'q': 'DNA.'}) is None
+    True
+    >>> cache.store('/search', {'q': 'DNA.'}, {'response': {'hits': []}})
+    >>> cache.load('/search', {'q': 'DNA.'})
+    {'response': {'hits': []}}
+    """
 
-def parse_album_file(album_file):
-    """Return attributes from a JSON file detailing an album.
-
-    read from a json file with attributes
-    'artist': string
-    'album': string
-    'song': list of strings
-
-    >>> artist, album, songs = parse_album_file('lyrics/vince/summertime06.json')
-    >>> artist
-    'Vince Staples'
-    >>> album
-    "Summertime '06"
-    >>> len(songs)
-    20
+    def __init__(self, directory=os.path.join(default_directory, 'http'), max_age=None):
+        self.directory = directory
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url, params):
+        key = json.dumps([url, params], sort_keys=True)
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf8')).hexdigest() + '.json')
+
+    def load(self, url, params=None):
+        path = self.path(url, params)
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def store(self, url, params, data):
+        write_atomically(self.path(url, params), json.dumps(data))
+
+class Manifest:
+    """A checkpoint of which tracks of an album have been
+    retrieved, kept in `manifest.json` of the target directory
+    and saved after every track.
     """
 
-    with open(album_file) as data_file:
-        data = json.load(data_file)
-    artist_name = data['artist']
-    album_name = data['album']
-    songs = data['songs']
-    return artist_name, album_name, songs
+    def __init__(self, target_directory):
+        self.path = os.path.join(target_directory, 'manifest.json')
+        try:
+            with open(self.path) as f:
+                self.tracks = json.load(f)['tracks']
+        except (OSError, ValueError, KeyError):
+            self.tracks = {}
+
+    def is_current(self, i, song_title, path, max_age=None):
+        """Return whether track i was retrieved, under the same title,
+        less than `max_age` seconds ago. Lyrics files written before
+        there was a manifest count if their first line is the title.
+        """
+
+        if not os.path.exists(path):
+            return False
+        entry = self.tracks.get(str(i))
+        if entry is None:
+            with open(path) as f:
+                if f.readline().rstrip('\n') != song_title:
+                    return False
+            self.tracks[str(i)] = {'title': song_title, 'retrieved': os.path.getmtime(path)}
+            entry = self.tracks[str(i)]
+        if entry['title'] != song_title:
+            return False
+        return max_age is None or time.time() - entry['retrieved'] <= max_age
+
+    def record(self, i, song_title):
+        self.tracks[str(i)] = {'title': song_title, 'retrieved': time.time()}
+        self.save()
+
+    def save(self):
+        write_atomically(self.path, json.dumps({'tracks': self.tracks}, indent=1, sort_keys=True))
+
+class AsyncFetcher:
+    """Downloads lyrics concurrently over one pooled HTTP session.
+
+    At most `concurrency` requests are in flight at once and, if
+    `rate` is given, at most `rate` requests start per second.
+    Responses with status 429 or 5xx are retried up to `retries`
+    times, waiting as long as the Retry-After header asks or else
+    `backoff` seconds doubled on every attempt.
+
+    Search and song API responses are kept in `cache`,
+    a `ResponseCache`, if one is given.
+
+    `parser` chooses how lyrics pages are parsed, as in `extract_lyrics`.
+
+    `api_url` and `web_url` point at the Genius API and website,
+    and can be changed to point at a stand-in server.
+
+    async with AsyncFetcher(token) as fetcher:
+        await fetcher.fetch_album('lyrics/kendrick/tpab.json', 'lyrics/kendrick/tpab/')
+    """
+
+    def __init__(self, token, concurrency=8, rate=None, retries=5, backoff=0.5,
+                 cache=None, parser='soup', api_url=base_url, web_url=web_url):
+        self.headers = {'Authorization': 'Bearer ' + token}
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.cache = cache
+        self.parser = parser
+        self.api_url = api_url
+        self.web_url = web_url
+        self.next_start = 0.0
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        self.session = aiohttp.ClientSession(connector=connector)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.throttle_lock = asyncio.Lock()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def throttle(self):
+        if not self.rate:
+            return
+        async with self.throttle_lock:
+            now = time.monotonic()
+            wait = self.next_start - now
+            self.next_start = max(now, self.next_start) + 1 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def get(self, url, params=None, authorize=True, as_json=True):
+        """Return the body of a GET request, retrying on 429 and 5xx."""
+        headers = self.headers if authorize else None
+        for attempt in range(self.retries + 1):
+            await self.throttle()
+            async with self.semaphore:
+                async with self.session.get(url, params=params, headers=headers) as response:
+                    if response.status != 429 and response.status < 500:
+                        response.raise_for_status()
+                        if as_json:
+                            return await response.json()
+                        return await response.text()
+                    retry_after = response.headers.get('Retry-After')
+            if attempt < self.retries:
+                if retry_after and retry_after.isdigit():
+                    delay = int(retry_after)
+                else:
+                    delay = self.backoff * 2 ** attempt
+                await asyncio.sleep(delay)
+        raise RetryError('Gave up on {} after {} attempts'.format(url, self.retries + 1))
+
+    async def get_cached(self, url, params=None, keep=None):
+        """Return a response from the cache, or else from a request.
+        Responses for which `keep` is false are neither cached nor
+        taken from the cache.
+        """
+
+        if self.cache is not None:
+            data = self.cache.load(url, params)
+            if data is not None and (keep is None or keep(data)):
+                return data
+        data = await self.get(url, params)
+        if self.cache is not None and (keep is None or keep(data)):
+            self.cache.store(url, params, data)
+        return data
+
+    async def search(self, song_title, artist_name):
+        # a search without a hit by the artist is asked again next
+        # time, since the song may have been added to Genius since
+        return await self.get_cached(self.api_url + '/search',
+                                     params={'q': song_title + ' ' + artist_name},
+                                     keep=lambda data: find_song_api_path(data, artist_name))
+
+    async def song(self, song_api_path):
+        return await self.get_cached(self.api_url + song_api_path)
+
+    async def fetch_lyrics(self, song_title, artist_name):
+        """Return the lyrics of a song, or None if no search hit is by the artist."""
+        song_api_path = find_song_api_path(await self.search(song_title, artist_name),
+                                           artist_name)
+        if song_api_path is None:
+            return None
+        path = (await self.song(song_api_path))['response']['song']['path']
+        page = await self.get(self.web_url + path, authorize=False, as_json=False)
+        return extract_lyrics(page, self.parser)
+
+    async def fetch_track(self, artist_name, song_title, path, on_retrieved=None):
+        try:
+            lyrics = await self.fetch_lyrics(song_title, artist_name)
+        except (aiohttp.ClientError, asyncio.TimeoutError, RetryError) as e:
+            print("Could not retrieve {}: {}".format(song_title, e))
+            return False
+        except LyricsNotFound:
+            lyrics = None
+        if lyrics is None:
+            print("Could not find {}".format(song_title))
+            return False
+        write_lyrics(path, song_title, lyrics)
+        if on_retrieved is not None:
+            on_retrieved()
+        print("Retrieved {}".format(song_title))
+        return True
+
+    async def fetch_album(self, album_file, target_directory, tracks=None, manifest=None):
+        """Download the lyrics of the songs of an album concurrently.
+        `tracks` limits the download to some track numbers, and
+        every retrieved track is recorded in `manifest` if given.
+        Returns the track numbers that were retrieved.
+        """
+
+        artist_name, album_name, songs = parse_album_file(album_file)
+        os.makedirs(target_directory, exist_ok=True)
+        if tracks is None:
+            tracks = range(len(songs))
+        tracks = list(tracks)
+        def recorder(i):
+            if manifest is not None:
+                return lambda: manifest.record(i, songs[i])
+            return None
+
+        retrieved = await asyncio.gather(*(
+            self.fetch_track(artist_name, songs[i], lyrics_path(target_directory, i),
+                             on_retrieved=recorder(i))
+            for i in tracks))
+        return [i for i, ok in zip(tracks, retrieved) if ok]
+
+    async def sync_album(self, album_file, target_directory, max_age=None):
+        """Download only the songs of an album that are missing from
+        target_directory, were retrieved under another title, or were
+        retrieved more than `max_age` seconds ago.
+        Returns the track numbers that were retrieved.
+        """
+
+        artist_name, album_name, songs = parse_album_file(album_file)
+        os.makedirs(target_directory, exist_ok=True)
+        manifest = Manifest(target_directory)
+        tracks = [i for i, song_title in enumerate(songs)
+                  if not manifest.is_current(i, song_title, lyrics_path(target_directory, i),
+                                             max_age)]
+        manifest.save()
+        return await self.fetch_album(album_file, target_directory, tracks, manifest)
+
+    async def sync_albums(self, albums, max_age=None):
+        """Sync many albums, given as (album_file, target_directory) pairs."""
+        return await asyncio.gather(*(self.sync_album(album_file, target_directory, max_age)
+                                      for album_file, target_directory in albums))
+
+    async def fetch_albums(self, albums):
+        """Download many albums, given as (album_file, target_directory) pairs."""
+        return await asyncio.gather(*(self.fetch_album(album_file, target_directory)
+                                      for album_file, target_directory in albums))
+
+def fetch_albums(albums, token, **options):
+    """Download many albums concurrently, given as
+    (album_file, target_directory) pairs. The options
+    are passed on to `AsyncFetcher`.
+    """
+
+    async def fetch():
+        async with AsyncFetcher(token, **options) as fetcher:
+            return await fetcher.fetch_albums(albums)
+    return asyncio.run(fetch())
+
+def sync_albums(albums, token, max_age=None, **options):
+    """Download what is missing or stale from many albums, given as
+    (album_file, target_directory) pairs, caching API responses in
+    a `ResponseCache` unless another cache is given. The options
+    are passed on to `AsyncFetcher`.
+    """
+
+    if 'cache' not in options:
+        options['cache'] = ResponseCache()
+    async def sync():
+        async with AsyncFetcher(token, **options) as fetcher:
+            return await fetcher.sync_albums(albums, max_age)
+    return asyncio.run(sync())
 
 if __name__ == '__main__':
     """
     command line arguments: album.json, target_directory
     $ python genius.py lyrics/kendrick/tpab.json lyrics/kendrick/tpab/
-    that last slash / in target_directory is important
+
+    download several albums at once with --async
+    $ python genius.py --async lyrics/kendrick/tpab.json lyrics/kendrick/tpab/ \\
+                               lyrics/kendrick/damn.json lyrics/kendrick/damn/
+
+    only download songs that are missing or older than a week with --sync
+    $ python genius.py --sync --max-age 7 lyrics/kendrick/tpab.json lyrics/kendrick/tpab/
     """
-    assert len(sys.argv) == 3, 'command line arguments: album.json, target_directory'
-    _, album_file, target_directory = sys.argv
+    parser = argparse.ArgumentParser()
+    parser.add_argument('albums', nargs='+', metavar='album.json target_directory')
+    parser.add_argument('--async', dest='concurrent', action='store_true',
+                        help='download songs and albums concurrently')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=None,
+                        help='most requests to start per second')
+    parser.add_argument('--sync', action='store_true',
+                        help='only download songs that are missing or stale')
+    parser.add_argument('--max-age', type=float, default=None,
+                        help='days after which songs and cached responses are stale')
+    parser.add_argument('--parser', choices=sorted(parsers), default='soup',
+                        help='how to find the lyrics in a page')
+    args = parser.parse_args()
+    assert len(args.albums) % 2 == 0, 'command line arguments: album.json, target_directory'
+    albums = list(zip(args.albums[::2], args.albums[1::2]))
     TOKEN = os.environ['TOKEN']
     headers = {'Authorization': 'Bearer ' + TOKEN}
-    artist_name, album_name, songs = parse_album_file(album_file)
-    for i, song_title in enumerate(songs):
-        print("Trying to retrieve {}".format(song_title))
-        # query string sent as request
-        data = {'q': song_title + ' ' + artist_name}
-        response = requests.get(search_url, data=data, headers=headers)
-        json = response.json()
-        for hit in json['response']['hits']:
-            if hit['result']['primary_artist']['name'] == artist_name:
-                song_api_path = hit['result']['api_path']
-                lyrics = lyrics_from_song_api_path(song_api_path)
-                # file name 00.txt, 01.txt, and so on
-                f = open(target_directory + "%02d" % (i,) + '.txt', 'w+')
-                f.write(song_title + '\n')
-                f.write(lyrics)
-                f.close()
+
+    if args.sync:
+        max_age = args.max_age * 24 * 60 * 60 if args.max_age is not None else None
+        sync_albums(albums, TOKEN, max_age=max_age, cache=ResponseCache(max_age=max_age),
+                    concurrency=args.concurrency, rate=args.rate, parser=args.parser)
+        sys.exit()
+
+    if args.concurrent:
+        fetch_albums(albums, TOKEN, concurrency=args.concurrency, rate=args.rate,
+                     parser=args.parser)
+        sys.exit()
+
+    for album_file, target_directory in albums:
+        artist_name, album_name, songs = parse_album_file(album_file)
+        for i, song_title in enumerate(songs):
+            print("Trying to retrieve {}".format(song_title))
+            # query string sent as request
+            data = {'q': song_title + ' ' + artist_name}
+            response = requests.get(search_url, data=data, headers=headers)
+            song_api_path = find_song_api_path(response.json(), artist_name)
+            if song_api_path is not None:
+                lyrics = lyrics_from_song_api_path(song_api_path, args.parser)
+                write_lyrics(lyrics_path(target_directory, i), song_title, lyrics)
                 print("Retrieved {}".format(song_title))
-                break
@@ -0,0 +1,133 @@
+"""
+Opt-in timing spans and counters for the hot paths of lexicon.
+
+Recording is off unless `LEXICON_INSTRUMENT` is set, or code runs
+inside `recording()`. While it is off a span is a shared object that
+does nothing and a count is a single test, so the instrumented code
+pays next to nothing. Set `LEXICON_INSTRUMENT=1` to print a report to
+stderr when the interpreter exits, or to a path ending in `.json` to
+write the summary there instead.
+
+Only the current process is recorded; work done by worker processes,
+such as those of a `Library` or `DocumentFrequencyPool`, is not.
+
+>>> with recording() as recorded:
+...     with span('work'):
+...         count('things', 3)
+>>> recorded['spans']['work']['calls'], recorded['counters']
+(1, {'things': 3})
+>>> enabled
+False
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+enabled = False
+# name -> [calls, total seconds, longest call in seconds]
+spans = {}
+counters = {}
+_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        with _lock:
+            totals = spans.setdefault(self.name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+        return False
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+null_span = NullSpan()
+
+def span(name):
+    """Return a context manager that times its block under `name`."""
+    return Span(name) if enabled else null_span
+
+def count(name, n=1):
+    """Add n to the counter `name`."""
+    if enabled:
+        with _lock:
+            counters[name] = counters.get(name, 0) + n
+
+def reset():
+    with _lock:
+        spans.clear()
+        counters.clear()
+
+@contextmanager
+def recording():
+    """Record everything in a block, starting from nothing, and
+    fill the dict it gives with the `summary` on the way out.
+    """
+
+    global enabled
+    was_enabled = enabled
+    reset()
+    enabled = True
+    recorded = {}
+    try:
+        yield recorded
+    finally:
+        enabled = was_enabled
+        recorded.update(summary())
+
+def summary():
+    """Return the spans and counters recorded so far as a dict."""
+    with _lock:
+        return {'spans': {name: {'calls': calls, 'seconds': seconds, 'longest': longest}
+                          for name, (calls, seconds, longest) in spans.items()},
+                'counters': dict(counters)}
+
+def report(file=None):
+    """Print the spans, slowest first, and the counters."""
+    file = file or sys.stderr
+    recorded = summary()
+    print("{:<32} {:>10} {:>12} {:>12}".format('span', 'calls', 'seconds', 'longest'),
+          file=file)
+    for name, totals in sorted(recorded['spans'].items(), key=lambda item: -item[1]['seconds']):
+        print("{:<32} {:>10,} {:>12.4f} {:>12.4f}".format(
+            name, totals['calls'], totals['seconds'], totals['longest']), file=file)
+    print("{:<32} {:>10}".format('counter', 'count'), file=file)
+    for name, n in sorted(recorded['counters'].items()):
+        print("{:<32} {:>10,}".format(name, n), file=file)
+
+def export(path):
+    """Write the `summary` to a JSON file."""
+    with open(path, 'w') as f:
+        json.dump(summary(), f, indent=4)
+
+def _report_at_exit(setting):
+    if setting.endswith('.json'):
+        export(setting)
+    else:
+        report()
+
+_setting = os.environ.get('LEXICON_INSTRUMENT', '')
+if _setting and _setting != '0':
+    enabled = True
+    atexit.register(_report_at_exit, _setting)
@@ -0,0 +1,245 @@
+import os
+import sys
+import json
+import random
+import argparse
+from array import array
+from bisect import bisect_right
+from collections import Counter
+
+from lexicon.music import tokenize_file
+
+MAGIC = b'LEXICON-MARKOV\n'
+
+class MarkovModel:
+    """
+    An n-gram model that generates text one word at a time,
+    choosing each word given the `order` words before it.
+
+    `train` counts which words follow each context of `order` words.
+    `compile` then lays those counts out as flat arrays, with the
+    counts of each context stored cumulatively, so that sampling
+    the next word is a bisect over that context's followers. A model
+    trained since it was last compiled is compiled when next used.
+
+    >>> model = MarkovModel(order=1)
+    >>> model.train('the cat sat on the mat'.split())
+    >>> model.compile()
+    >>> sorted(model.followers(['the']).items())
+    [('cat', 1), ('mat', 1)]
+    >>> rng = random.Random(0)
+    >>> model.generate(['sat'], length=4, rng=rng)
+    ['sat', 'on', 'the', 'cat']
+    >>> model.generate(['dog'])
+    Traceback (most recent call last):
+    ...
+    ValueError: no word ever followed ['dog']
+    >>> model.train('the dog ran'.split())
+    >>> model.generate(['dog'])
+    ['dog', 'ran']
+    >>> MarkovModel().generate()
+    Traceback (most recent call last):
+    ...
+    ValueError: the model has not been trained
+    """
+
+    def __init__(self, order=1):
+        self.order = order
+        self.counts = {}
+        self.words = []
+        self.ids = {}
+        self.index = {}
+        self.offsets = array('Q', [0])
+        self.followers_ids = array('I')
+        self.cumulative = array('Q')
+        self.compiled = True
+
+    def intern(self, word):
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def train(self, words):
+        """Count the n-grams of a sequence of words. Sequences
+        passed in separate calls are not joined together.
+        """
+
+        ids = [self.intern(word) for word in words]
+        for i in range(len(ids) - self.order):
+            context = tuple(ids[i:i + self.order])
+            self.counts.setdefault(context, Counter())[ids[i + self.order]] += 1
+        self.compiled = False
+
+    def compile(self):
+        """Lay the counts out as arrays for sampling."""
+        self.index = {}
+        self.offsets = array('Q', [0])
+        self.followers_ids = array('I')
+        self.cumulative = array('Q')
+        for context, followers in self.counts.items():
+            self.index[context] = len(self.index)
+            total = 0
+            for i, count in followers.items():
+                total += count
+                self.followers_ids.append(i)
+                self.cumulative.append(total)
+            self.offsets.append(len(self.followers_ids))
+        self.compiled = True
+
+    def compiled_index(self):
+        if not self.compiled:
+            self.compile()
+        return self.index
+
+    def followers(self, context):
+        """Return the counts of the words that follow a context."""
+        i = self.compiled_index().get(tuple(self.ids.get(word) for word in context))
+        if i is None:
+            return {}
+        followers = {}
+        previous = 0
+        for j in range(self.offsets[i], self.offsets[i + 1]):
+            followers[self.words[self.followers_ids[j]]] = self.cumulative[j] - previous
+            previous = self.cumulative[j]
+        return followers
+
+    def next_id(self, context, rng):
+        i = self.index.get(context)
+        if i is None:
+            return None
+        low, high = self.offsets[i], self.offsets[i + 1]
+        r = rng.randrange(self.cumulative[high - 1])
+        return self.followers_ids[bisect_right(self.cumulative, r, low, high)]
+
+    def generate(self, seed=None, length=15, rng=random):
+        """Return a list of `length` words that starts with `seed`,
+        `order` words long, or with a random context if it is None.
+        Stops early if no word ever followed the current context.
+        Raises ValueError for a seed that is not `order` words long
+        or that no word ever followed, or if nothing was trained.
+        """
+
+        index = self.compiled_index()
+        if not index:
+            raise ValueError("the model has not been trained")
+        if seed is None:
+            context = rng.choice(list(index))
+        else:
+            seed = list(seed)
+            if len(seed) != self.order:
+                raise ValueError("the seed must be {} words long, not {}".format(
+                    self.order, len(seed)))
+            context = tuple(self.ids.get(word) for word in seed)
+            if context not in index:
+                raise ValueError("no word ever followed {}".format(seed))
+        ids = list(context)
+        while len(ids) < length:
+            i = self.next_id(context, rng)
+            if i is None:
+                break
+            ids.append(i)
+            context = context[1:] + (i,)
+        return [self.words[i] for i in ids[:length]]
+
+    def generate_many(self, n, seed=None, length=15, rng=random):
+        """Return n generated sequences of words."""
+        return [self.generate(seed, length, rng) for _ in range(n)]
+
+    def save(self, path):
+        """Write the compiled model to a file."""
+        contexts = array('I')
+        for context in self.compiled_index():
+            contexts.extend(context)
+        header = {'order': self.order,
+                  'words': self.words,
+                  'contexts': len(self.index),
+                  'followers': len(self.followers_ids),
+                  'byteorder': sys.byteorder}
+        with open(path, 'wb') as f:
+            f.write(MAGIC)
+            f.write(json.dumps(header).encode('utf8') + b'\n')
+            for values in (contexts, self.offsets, self.followers_ids, self.cumulative):
+                values.tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        """Return a compiled model read from a file written by `save`.
+
+        >>> import tempfile
+        >>> model = MarkovModel(order=2)
+        >>> model.train('la di da la di dum'.split())
+        >>> model.compile()
+        >>> path = os.path.join(tempfile.mkdtemp(), 'model')
+        >>> model.save(path)
+        >>> MarkovModel.load(path).followers(['la', 'di'])
+        {'da': 1, 'dum': 1}
+        """
+
+        with open(path, 'rb') as f:
+            assert f.readline() == MAGIC, 'Not a saved MarkovModel'
+            header = json.loads(f.readline())
+            model = cls(header['order'])
+            model.words = header['words']
+            model.ids = {word: i for i, word in enumerate(model.words)}
+            arrays = [('I', header['contexts'] * model.order),
+                      ('Q', header['contexts'] + 1),
+                      ('I', header['followers']),
+                      ('Q', header['followers'])]
+            contexts, model.offsets, model.followers_ids, model.cumulative = [
+                read_array(f, typecode, n, header['byteorder']) for typecode, n in arrays]
+        model.index = {tuple(contexts[i:i + model.order]): n
+                       for n, i in enumerate(range(0, len(contexts), model.order))}
+        return model
+
+def read_array(f, typecode, n, byteorder):
+    values = array(typecode)
+    values.fromfile(f, n)
+    if byteorder != sys.byteorder:
+        values.byteswap()
+    return values
+
+def lyrics_files(root):
+    for directory, _, files in sorted(os.walk(root)):
+        for name in sorted(files):
+            if name.endswith('.txt'):
+                yield os.path.join(directory, name)
+
+if __name__ == '__main__':
+    """
+    train on every song under a directory and generate text
+    $ python -m lexicon.markov lyrics/kendrick/ --order 2 --save kendrick.model
+
+    generate from a saved model without training again
+    $ python -m lexicon.markov --load kendrick.model --count 5
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('root', nargs='?', help='directory of lyrics to train on')
+    parser.add_argument('--order', type=int, default=1)
+    parser.add_argument('--seed', nargs='*', help='words to start from')
+    parser.add_argument('--length', type=int, default=15)
+    parser.add_argument('--count', type=int, default=1)
+    parser.add_argument('--save')
+    parser.add_argument('--load')
+    args = parser.parse_args()
+
+    if not args.root and not args.load:
+        parser.error('give a directory to train on or --load')
+    if args.load:
+        model = MarkovModel.load(args.load)
+    else:
+        model = MarkovModel(args.order)
+        for path in lyrics_files(args.root):
+            model.train(word.lower() for word in tokenize_file(path))
+        model.compile()
+    if args.save:
+        model.save(args.save)
+    # the model is trained on lowercase words
+    seed = [word.lower() for word in args.seed] if args.seed else None
+    try:
+        generated = model.generate_many(args.count, seed, args.length)
+    except ValueError as e:
+        parser.error(str(e))
+    for words in generated:
+        print(' '.join(words))
@@ -1,12 +1,15 @@
 import os
-from nltk import RegexpTokenizer
-from nltk import FreqDist
-from nltk import WordNetLemmatizer
-from nltk.corpus import stopwords
-from nltk.corpus import PlaintextCorpusReader
-from nltk.stem.snowball import SnowballStemmer
+import re
+import json
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import chain
 
-from lexicon import genius
+from lexicon import instrument
+from lexicon.cache import TokenCache, default_directory
 
 pattern = r"""(?x)               # set flag to allow verbose regexps
               (?:[A-Z]\.)+       # abbreviations, e.g. U.S.A.
@@ -14,15 +17,185 @@ pattern = r"""(?x)               # set flag to allow verbose regexps
               |\w+(?:[-’']\w+)*  # words w/ optional internal hyphens/apostrophe
               |(?:[+/\-@&*])     # special characters with meanings
            """
-tokenizer = RegexpTokenizer(pattern)
+# the same flags that RegexpTokenizer compiles `pattern` with
+compiled_pattern = re.compile(pattern, re.UNICODE | re.MULTILINE | re.DOTALL)
 
 punctuation = {'!', '"', '#', '$', '%', '&', "'", '(', ')', '*', '+', ',',
         '-', '.', '/', '’', ':', ';', '<', '=', '>', '?', '@', '[', '\\',
         ']', '^', '_', '`', '{', '|', '}', '~'}
 
-english_stopwords = set(stopwords.words('english'))
-stemmer = SnowballStemmer('english')
-wnl = WordNetLemmatizer()
+# set LEXICON_CACHE to a directory for tokenized songs, or to nothing to disable it
+cache_directory = os.environ.get('LEXICON_CACHE', default_directory)
+token_cache = TokenCache(os.path.expanduser(cache_directory)) if cache_directory else None
+
+# Importing nltk takes most of a second, so its resources are only
+# loaded when first used: by a `Normalizer` that needs them, or when
+# read from this module as `music.stemmer` and the like.
+
+def load_stopwords():
+    from nltk.corpus import stopwords
+    return set(stopwords.words('english'))
+
+def load_stemmer():
+    from nltk.stem.snowball import SnowballStemmer
+    return SnowballStemmer('english')
+
+def load_lemmatizer():
+    from nltk import WordNetLemmatizer
+    return WordNetLemmatizer()
+
+def load_tokenizer():
+    from nltk import RegexpTokenizer
+    return RegexpTokenizer(pattern)
+
+loaders = {'english_stopwords': load_stopwords,
+           'stemmer': load_stemmer,
+           'wnl': load_lemmatizer,
+           'tokenizer': load_tokenizer}
+
+def __getattr__(name):
+    # only reached while a resource has not been loaded yet
+    if name not in loaders:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = globals()[name] = loaders[name]()
+    return value
+
+def resource(name):
+    """Return one of the lazily loaded NLTK resources by name."""
+    return globals().get(name) or __getattr__(name)
+
+def parse_album_file(album_file):
+    """Return attributes from a JSON file detailing an album.
+
+    read from a json file with attributes
+    'artist': string
+    'album': string
+    'song': list of strings
+
+    >>> artist, album, songs = parse_album_file('lyrics/vince/summertime06.json')
+    >>> artist
+    'Vince Staples'
+    >>> album
+    "Summertime '06"
+    >>> len(songs)
+    20
+    """
+
+    with open(album_file) as data_file:
+        data = json.load(data_file)
+    artist_name = data['artist']
+    album_name = data['album']
+    songs = data['songs']
+    return artist_name, album_name, songs
+
+def tokenize_file(fileid, encoding='utf8'):
+    """Return a generator of the tokens of a text file.
+
+    The file is read in one go and matched against `pattern`
+    directly, which gives the same tokens as a
+    `PlaintextCorpusReader` using `tokenizer` without going
+    through its stream views.
+
+    >>> import tempfile
+    >>> from nltk.corpus import PlaintextCorpusReader
+    >>> directory = tempfile.mkdtemp()
+    >>> with open(os.path.join(directory, 'song.txt'), 'w') as f:
+    ...     _ = f.write("DNA.\\nI got loyalty, got royalty inside my D.N.A.\\n\\n100% that's me")
+    >>> tokens = list(tokenize_file(os.path.join(directory, 'song.txt')))
+    >>> tokens[:4]
+    ['DNA', 'I', 'got', 'loyalty']
+    >>> reader = PlaintextCorpusReader(directory, 'song.txt', word_tokenizer=resource('tokenizer'))
+    >>> tokens == list(reader.words())
+    True
+    """
+
+    with open(fileid, encoding=encoding) as f:
+        text = f.read()
+    for match in compiled_pattern.finditer(text):
+        yield match.group()
+
+class Normalizer:
+    """
+    Lowercases words and drops punctuation, optionally dropping
+    stopwords, stemming and lemmatizing.
+
+    Lyrics repeat the same few hundred words over and over, so the
+    result for each distinct word is memoized in a cache that holds
+    at most `cache_size` words.
+
+    Keyword arguments:
+    nostopwords -- whether to drop common English words (default False)
+    stem -- whether to stem words (default False)
+    lemmatize -- whether to lemmatize words (default False)
+
+    >>> n = Normalizer(stem=True)
+    >>> n.batch(["Hello", "you're", "wonderful", ",", "wonderful"])
+    ['hello', "you'r", 'wonder', 'wonder']
+    >>> n.stats()['misses']
+    4
+    """
+
+    def __init__(self, nostopwords=False, stem=False, lemmatize=False, cache_size=2 ** 16):
+        self.nostopwords = nostopwords
+        self.stem = stem
+        self.lemmatize = lemmatize
+        # load only the resources these options need
+        self.stopwords = resource('english_stopwords') if nostopwords else None
+        self.stemmer = resource('stemmer') if stem else None
+        self.lemmatizer = resource('wnl') if lemmatize else None
+        self.cached = lru_cache(maxsize=cache_size)(self.normalize_word)
+
+    def settings(self):
+        return {'nostopwords': self.nostopwords,
+                'stem': self.stem,
+                'lemmatize': self.lemmatize}
+
+    def normalize_word(self, word):
+        """Return the normalized word, or None if it is dropped."""
+        word = word.lower()
+        if word in punctuation:
+            return None
+        if self.nostopwords and word in self.stopwords:
+            return None
+        if self.stem:
+            word = self.stemmer.stem(word)
+        if self.lemmatize:
+            word = self.lemmatizer.lemmatize(word)
+        return word
+
+    def __call__(self, words):
+        """Return a generator of normalized words."""
+        for word in words:
+            word = self.cached(word)
+            if word is not None:
+                yield word
+
+    def batch(self, words):
+        """Return a list of normalized words, normalizing
+        each distinct word only once.
+        """
+
+        words = list(words)
+        normalized = {word: self.cached(word) for word in set(words)}
+        return [normalized[word] for word in words if normalized[word] is not None]
+
+    def stats(self):
+        """Return the hits, misses, size and hit rate of the cache."""
+        info = self.cached.cache_info()
+        lookups = info.hits + info.misses
+        return {'hits': info.hits,
+                'misses': info.misses,
+                'size': info.currsize,
+                'hit_rate': info.hits / lookups if lookups else 0.0}
+
+normalizers = {}
+
+def get_normalizer(nostopwords=False, stem=False, lemmatize=False):
+    """Return the shared `Normalizer` for some options."""
+    key = (nostopwords, stem, lemmatize)
+    if key not in normalizers:
+        normalizers[key] = Normalizer(*key)
+    return normalizers[key]
 
 def normalize(words, nostopwords=False, stem=False, lemmatize=False):
     """Return a generator to normalize words.
@@ -37,69 +210,257 @@ def normalize(words, nostopwords=False, stem=False, lemmatize=False):
     >>> list(normalize(["Hello", "you're", "wonderful"], stem=True))
     ['hello', "you'r", 'wonder']
     """
-    for word in words:
-        word = word.lower()
-        if word in punctuation:
-            continue
-        if nostopwords and word in english_stopwords:
-            continue
-        if stem:
-            word = stemmer.stem(word)
-        if lemmatize:
-            word = wnl.lemmatize(word)
-        yield word
+    return get_normalizer(nostopwords, stem, lemmatize)(words)
+
+class Vocabulary:
+    """
+    An interning table that maps each distinct word to an integer id,
+    so that collections store each word once and their tokens as ids.
+
+    >>> v = Vocabulary()
+    >>> v.encode(['la', 'di', 'la']).tolist()
+    [0, 1, 0]
+    >>> v.decode([1, 0])
+    ['di', 'la']
+    >>> v.id('la'), v.id('da')
+    (0, None)
+    """
+
+    __slots__ = ('ids', 'words')
+
+    def __init__(self):
+        self.ids = {}
+        self.words = []
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word):
+        return word in self.ids
+
+    def __getitem__(self, i):
+        return self.words[i]
+
+    def id(self, word):
+        return self.ids.get(word)
+
+    def intern(self, word):
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def encode(self, words):
+        return array('I', map(self.intern, words))
+
+    def decode(self, ids):
+        return [self.words[i] for i in ids]
+
+# every TextCollection in a process shares this table
+vocabulary = Vocabulary()
 
 class TextCollection:
     """
     A collection of words that supports various Python operations.
     This is constructed by passing in an iterable of words.
 
+    The words are stored as an array of ids from the shared
+    `vocabulary`, with the counts of each distinct id kept
+    in a pair of sorted arrays.
+
+    The keyword arguments choose how words are normalized,
+    as in `Normalizer`.
+
     >>> tc = TextCollection(['hello', 'world'])
     >>> 'hello' in tc
     True
     >>> tc.freq('world')
     0.5
+    >>> list(tc)
+    ['hello', 'world']
+    >>> list(TextCollection(['The', 'worlds'], nostopwords=True, stem=True))
+    ['world']
+    >>> import pickle
+    >>> copy = pickle.loads(pickle.dumps(TextCollection(['la', 'di', 'la'])))
+    >>> list(copy), copy.count('la'), copy.wordcounts() == TextCollection(['la', 'di', 'la']).wordcounts()
+    (['la', 'di', 'la'], 2, True)
     """
 
-    def __init__(self, words):
-        words = normalize(words)
-        self.words = list(words)
-        self.lexicon = set(self.words)
-        self.fdist = FreqDist(self.words)
+    __slots__ = ('tokens', 'types', 'counts')
+
+    def __init__(self, words, nostopwords=False, stem=False, lemmatize=False):
+        normalizer = get_normalizer(nostopwords, stem, lemmatize)
+        self.tokens = vocabulary.encode(normalizer.batch(words))
+        self.count_types()
+
+    def count_types(self):
+        counts = Counter(self.tokens)
+        self.types = array('I', sorted(counts))
+        self.counts = array('I', [counts[i] for i in self.types])
+
+    def find(self, word):
+        """Return the position of a word in `types`, or None."""
+        i = vocabulary.id(word)
+        if i is None:
+            return None
+        position = bisect_left(self.types, i)
+        if position < len(self.types) and self.types[position] == i:
+            return position
+        return None
 
     def __contains__(self, word):
-        return word in self.lexicon
+        return self.find(word) is not None
 
     def __iter__(self):
-        return iter(self.words)
+        return map(vocabulary.words.__getitem__, self.tokens)
 
     def __len__(self):
-        return len(self.words)
+        return len(self.tokens)
 
+    def size(self):
+        """Return the number of words in the collection."""
+        return len(self.tokens)
+
+    def __getstate__(self):
+        state = {name: getattr(self, name)
+                 for cls in type(self).__mro__
+                 for name in getattr(cls, '__slots__', ())
+                 if hasattr(self, name)}
+        # ids only mean something to this process's vocabulary,
+        # so tokens are pickled as positions into their own words
+        positions = {i: position for position, i in enumerate(self.types)}
+        state['types'] = vocabulary.decode(self.types)
+        state['tokens'] = array('I', [positions[i] for i in self.tokens])
+        del state['counts']
+        return state
+
+    def __setstate__(self, state):
+        # imported here so that importing this module stays light
+        import numpy as np
+        ids = np.frombuffer(vocabulary.encode(state.pop('types')), dtype=np.uint32)
+        positions = np.frombuffer(state.pop('tokens'), dtype=np.uint32)
+        self.tokens = array('I', ids[positions].tobytes())
+        # the same as count_types, without counting token by token
+        order = np.argsort(ids)
+        counts = np.bincount(positions, minlength=len(ids)).astype(np.uint32)
+        self.types = array('I', ids[order].tobytes())
+        self.counts = array('I', counts[order].tobytes())
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
     def words(self):
-        return iter(self.words)
+        return vocabulary.decode(self.tokens)
+
+    @property
+    def lexicon(self):
+        return set(vocabulary.decode(self.types))
+
+    @property
+    def fdist(self):
+        from nltk import FreqDist
+        with instrument.span('music.fdist'):
+            return FreqDist(dict(self.wordcounts()))
 
     def count(self, word):
-        return self.fdist[word]
+        position = self.find(word)
+        return 0 if position is None else self.counts[position]
 
     def freq(self, word):
-        return self.fdist.freq(word)
+        size = self.size()
+        if size == 0:
+            return 0
+        return self.count(word) / size
 
     def wordcounts(self):
-        return self.fdist.items()
+        return list(zip(vocabulary.decode(self.types), self.counts))
+
+
+class Aggregate(TextCollection):
+    """
+    A TextCollection made of smaller collections, such as an album
+    of songs. Its counts are the sums of the counts of its parts and
+    are only computed when first needed; its tokens are never
+    concatenated into one array unless `tokens` itself is read.
+    Iterating over an aggregate gives its parts.
+
+    >>> agg = Aggregate([TextCollection(['la', 'di']), TextCollection(['la'])])
+    >>> len(agg), agg.size()
+    (2, 3)
+    >>> agg.count('la'), 'di' in agg, agg.freq('di')
+    (2, True, 0.3333333333333333)
+    >>> agg.words
+    ['la', 'di', 'la']
+    """
+
+    __slots__ = ('parts',)
 
+    def __init__(self, parts):
+        self.parts = list(parts)
 
-class Album(TextCollection):
+    def __getattr__(self, name):
+        # only reached while one of the lazy slots is still unset
+        if name in ('types', 'counts'):
+            with instrument.span('music.aggregate_counts'):
+                self.count_types()
+        elif name == 'tokens':
+            self.tokens = array('I', chain.from_iterable(part.tokens for part in self.parts))
+        else:
+            raise AttributeError(name)
+        return object.__getattribute__(self, name)
+
+    def count_types(self):
+        counts = Counter()
+        for part in self.parts:
+            for i, count in zip(part.types, part.counts):
+                counts[i] += count
+        self.types = array('I', sorted(counts))
+        self.counts = array('I', [counts[i] for i in self.types])
+
+    def __len__(self):
+        return len(self.parts)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def __getitem__(self, index):
+        return self.parts[index]
+
+    def size(self):
+        return sum(part.size() for part in self.parts)
+
+    def __getstate__(self):
+        lazy = {'tokens', 'types', 'counts'}
+        return {name: getattr(self, name)
+                for cls in type(self).__mro__
+                for name in getattr(cls, '__slots__', ())
+                if name not in lazy and hasattr(self, name)}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def words(self):
+        return vocabulary.decode(chain.from_iterable(part.tokens for part in self.parts))
+
+
+class Album(Aggregate):
     """
     A TextCollection that is formed from text files containing
-    the lyrics of an album.
+    the lyrics of an album. Each file is read once, by its `Song`.
+    The keyword arguments choose how words are normalized,
+    as in `Normalizer`.
 
     >>> damn = Album('lyrics/kendrick/damn.json')
     >>> len(damn)
     14
     """
 
-    def __init__(self, album_file):
+    __slots__ = ('artist', 'title')
+
+    def __init__(self, album_file, nostopwords=False, stem=False, lemmatize=False):
         """
         if the album info is given by `lyrics/kendrick/damn.json
         then the corpus path is given by `lyrics/kendrick/damn/`
@@ -108,35 +469,77 @@ class Album(TextCollection):
         # split into ('lyrics/kendrick/damn', '.json')
         root, ext = os.path.splitext(album_file)
         root += '/'
-        self.artist, self.title, song_titles = genius.parse_album_file(album_file)
-        self.corpus = PlaintextCorpusReader(root,
-                                            r'.*\.txt',
-                                            word_tokenizer=tokenizer)
-        super().__init__(self.corpus.words())
-        self.tracks = [Song(root + fileid, title=title)
-                       for title, fileid 
-                       in zip(song_titles, self.corpus.fileids())]
+        self.artist, self.title, song_titles = parse_album_file(album_file)
+        fileids = sorted(f for f in os.listdir(root) if re.fullmatch(r'.*\.txt', f))
+        super().__init__(Song(root + fileid, title=title, nostopwords=nostopwords,
+                              stem=stem, lemmatize=lemmatize)
+                         for title, fileid in zip(song_titles, fileids))
 
-    def __len__(self):
-        return len(self.tracks)
+    @property
+    def tracks(self):
+        return self.parts
 
-    def __iter__(self):
-        return iter(self.tracks)
+class Artist(Aggregate):
+    """
+    A TextCollection that is formed from the albums of an artist.
 
-    def __getitem__(self, index):
-        return self.tracks[index]
+    >>> kendrick = Artist('Kendrick Lamar', [Album('lyrics/kendrick/damn.json'),
+    ...                                      Album('lyrics/kendrick/tpab.json')])
+    >>> len(kendrick), len(list(kendrick.songs()))
+    (2, 30)
+    """
+
+    __slots__ = ('name',)
+
+    def __init__(self, name, albums):
+        self.name = name
+        super().__init__(albums)
+
+    @property
+    def albums(self):
+        return self.parts
+
+    def songs(self):
+        return chain.from_iterable(self.parts)
 
 class Song(TextCollection):
-    def __init__(self, fileid, title=None):
+    """
+    A TextCollection that is formed from a text file containing
+    the lyrics of a song. The normalized words of the file are
+    kept in `token_cache` so that later runs skip tokenizing it.
+    The keyword arguments choose how words are normalized,
+    as in `Normalizer`.
+    """
+
+    __slots__ = ('title', 'fileid')
+
+    def __init__(self, fileid, title=None, nostopwords=False, stem=False, lemmatize=False):
         self.title = title
         self.fileid = fileid
-        self.corpus = PlaintextCorpusReader('.', 
-                                            fileid,
-                                            word_tokenizer=tokenizer)
-        super().__init__(self.corpus.words())
+        normalizer = get_normalizer(nostopwords, stem, lemmatize)
+        settings = dict(normalizer.settings(), pattern=pattern)
+        with instrument.span('music.cache_load'):
+            words = token_cache.load(fileid, settings) if token_cache else None
+        if words is None:
+            with instrument.span('music.tokenize'):
+                tokens = list(tokenize_file(fileid))
+            with instrument.span('music.normalize'):
+                words = normalizer.batch(tokens)
+            instrument.count('music.files_read')
+            instrument.count('music.tokens_produced', len(tokens))
+            if token_cache:
+                with instrument.span('music.cache_store'):
+                    token_cache.store(fileid, settings, words)
+        else:
+            instrument.count('music.cache_hits')
+        self.tokens = vocabulary.encode(words)
+        with instrument.span('music.count_types'):
+            self.count_types()
 
     def __repr__(self):
-        title = self.corpus.sents()[0]
+        # the first line of a lyrics file is the title of the song
+        with open(self.fileid, encoding='utf8') as f:
+            title = compiled_pattern.findall(f.readline())
         return "<Song " + ' '.join(title) + ">"
 
     def __eq__(self, other):
@@ -145,5 +548,65 @@ class Song(TextCollection):
     def __hash__(self):
         return hash(self.fileid)
 
+class Library:
+    """
+    Every album found under a directory such as `lyrics/`.
+    An album is a JSON file that details it next to a directory
+    of lyrics with the same name, as `Album` expects. Albums are
+    loaded in parallel by a pool of `processes` worker processes
+    (one per core by default) and kept in the order of their paths.
+    The keyword arguments choose how words are normalized,
+    as in `Normalizer`.
+
+    >>> library = Library('lyrics/')
+    >>> [album.title for album in library.artists[0]]
+    ['Good For You']
+    >>> len(library.artists), len(library), len(list(library.songs()))
+    (4, 7, 112)
+    """
+
+    def __init__(self, root, processes=None, nostopwords=False, stem=False, lemmatize=False):
+        self.root = root
+        album_files = self.discover(root)
+        load = partial(Album, nostopwords=nostopwords, stem=stem, lemmatize=lemmatize)
+        processes = processes or os.cpu_count()
+        if processes == 1 or len(album_files) <= 1:
+            self.albums = [load(album_file) for album_file in album_files]
+        else:
+            chunksize = max(1, len(album_files) // (processes * 4))
+            with ProcessPoolExecutor(processes) as executor:
+                self.albums = list(executor.map(load, album_files, chunksize=chunksize))
+
+        by_artist = {}
+        for album in self.albums:
+            by_artist.setdefault(album.artist, []).append(album)
+        self.artists = [Artist(name, albums) for name, albums in by_artist.items()]
+
+    @staticmethod
+    def discover(root):
+        """Return the sorted paths of the album files under root
+        that have a directory of lyrics next to them.
+        """
+
+        album_files = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                if name.endswith('.json') and os.path.isdir(os.path.splitext(path)[0]):
+                    album_files.append(path)
+        return sorted(album_files)
+
+    def __len__(self):
+        return len(self.albums)
+
+    def __iter__(self):
+        return iter(self.albums)
+
+    def __getitem__(self, index):
+        return self.albums[index]
+
+    def songs(self):
+        return chain.from_iterable(self.albums)
+
 if __name__ == '__main__':
     damn = Album('lyrics/kendrick/damn.json')
@@ -0,0 +1,217 @@
+import json
+import inspect
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+from lexicon.music import Library
+from lexicon.tfidf import TfidfVectorizer, tfidf
+from lexicon.similarity import SimilarityIndex
+
+
+class LRUCache:
+    """A mapping of at most `maxsize` entries that can be shared
+    between threads. Once full, the entry that was used least
+    recently is evicted to make room.
+
+    >>> cache = LRUCache(2)
+    >>> cache.put('a', 1); cache.put('b', 2)
+    >>> cache.get('a')
+    1
+    >>> cache.put('c', 3)
+    >>> cache.get('b') is None, cache.get('a'), cache.get('c')
+    (True, 1, 3)
+    >>> cache.stats()
+    {'hits': 3, 'misses': 1, 'size': 2, 'maxsize': 2}
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self.entries), 'maxsize': self.maxsize}
+
+
+class Service:
+    """Answers queries about every song of a `Library`, which is
+    loaded and indexed once. Songs are named by their position in
+    `songs`. Each query is a method that takes its parameters as
+    strings and returns something that can be encoded as JSON; it
+    raises LookupError for songs or words that do not exist and
+    ValueError for malformed parameters.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self.songs, self.albums = [], []
+        for album in library:
+            for song in album:
+                self.albums.append(album)
+                self.songs.append(song)
+        self.vectorizer = TfidfVectorizer()
+        self.matrix = self.vectorizer.fit_transform(self.songs)
+        # the document frequencies the vectorizer counted while fitting
+        self.index = self.vectorizer.index
+        self.similarity = SimilarityIndex(self.songs, self.vectorizer, self.matrix)
+        self.queries = {'songs': self.list_songs,
+                        'important_words': self.important_words,
+                        'tfidf': self.tfidf,
+                        'count': self.count,
+                        'similar': self.similar}
+
+    def position(self, song):
+        try:
+            position = int(song)
+        except ValueError:
+            raise ValueError("song must be a number, not {!r}".format(song))
+        if not 0 <= position < len(self.songs):
+            raise LookupError("there is no song {}".format(position))
+        return position
+
+    @staticmethod
+    def number(value, name):
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError("{} must be a number, not {!r}".format(name, value))
+        if number < 0:
+            raise ValueError("{} must not be negative".format(name))
+        return number
+
+    def describe(self, position):
+        album = self.albums[position]
+        return {'song': position, 'title': self.songs[position].title,
+                'album': album.title, 'artist': album.artist}
+
+    def list_songs(self):
+        return [self.describe(i) for i in range(len(self.songs))]
+
+    def important_words(self, song, n='10'):
+        position = self.position(song)
+        terms = self.vectorizer.important_words(self.matrix[position], n=self.number(n, 'n'))[0]
+        return [{'word': term.word, 'score': term.score} for term in terms]
+
+    def tfidf(self, word, song):
+        if word not in self.index:
+            raise LookupError("{!r} is not in any song".format(word))
+        return tfidf(word, self.songs[self.position(song)], self.index)
+
+    def count(self, word, song=None):
+        if song is None:
+            return sum(document.count(word) for document in self.songs)
+        return self.songs[self.position(song)].count(word)
+
+    def similar(self, song, k='10'):
+        matches = self.similarity.similar(self.songs[self.position(song)],
+                                          k=self.number(k, 'k'))
+        return [dict(self.describe(self.similarity.position(match.document)), score=match.score)
+                for match in matches]
+
+    def answer(self, query, params):
+        if query not in self.queries:
+            raise LookupError("there is no query {!r}".format(query))
+        answer = self.queries[query]
+        try:
+            inspect.signature(answer).bind(**params)
+        except TypeError as e:
+            raise ValueError(str(e))
+        return answer(**params)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves `GET /<query>?<params>` of the server's `Service`
+    as JSON, reusing encoded answers from the server's cache.
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = url.path.strip('/')
+        params = dict(parse_qsl(url.query))
+        if query == 'stats':
+            self.respond(200, json.dumps(self.server.cache.stats()).encode('utf8'))
+            return
+        key = (query, tuple(sorted(params.items())))
+        body = self.server.cache.get(key)
+        if body is None:
+            try:
+                answer = self.server.service.answer(query, params)
+            except LookupError as e:
+                self.respond(404, json.dumps({'error': str(e)}).encode('utf8'))
+                return
+            except ValueError as e:
+                self.respond(400, json.dumps({'error': str(e)}).encode('utf8'))
+                return
+            body = json.dumps(answer).encode('utf8')
+            self.server.cache.put(key, body)
+        self.respond(200, body)
+
+    def respond(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class Server(ThreadingHTTPServer):
+    """An HTTP server that answers each request in its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, service, address=('127.0.0.1', 8000), cache_size=1024, verbose=False):
+        self.service = service
+        self.cache = LRUCache(cache_size)
+        self.verbose = verbose
+        super().__init__(address, Handler)
+
+if __name__ == '__main__':
+    """
+    $ python -m lexicon.server lyrics/ --port 8000
+    $ curl 'localhost:8000/important_words?song=3&n=5'
+    $ curl 'localhost:8000/similar?song=3&k=5'
+    """
+    parser = argparse.ArgumentParser(description='Serve queries about a library of lyrics.')
+    parser.add_argument('root', help='directory of albums, as for Library')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--cache-size', type=int, default=1024)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    service = Service(Library(args.root, processes=args.processes))
+    server = Server(service, (args.host, args.port), args.cache_size, args.verbose)
+    print("Serving {} songs on http://{}:{}".format(len(service.songs), *server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
@@ -0,0 +1,232 @@
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+from lexicon import instrument
+from lexicon.tfidf import TfidfVectorizer
+
+
+Match = namedtuple('Match', ['document', 'score'])
+
+def normalize_rows(matrix):
+    """Scale every row of a sparse matrix to unit length.
+    Rows without any nonzero entries are left alone.
+    """
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return csr_matrix(diags(1 / norms) @ matrix)
+
+def runs(starts, lengths):
+    """Return the positions that make up runs of the given
+    starts and lengths, one run after the other.
+
+    >>> runs(np.array([5, 0]), np.array([2, 3])).tolist()
+    [5, 6, 0, 1, 2]
+    """
+
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return np.arange(lengths.sum()) + offsets
+
+def top_k(indices, scores, k):
+    """Return the positions of the k highest scores, breaking
+    ties by the lower index, and leaving out scores of zero.
+    """
+
+    if len(scores) > k > 0:
+        # only scores tied with the k-th highest or above need sorting
+        contenders = np.flatnonzero(scores >= np.partition(scores, -k)[-k])
+    else:
+        contenders = np.arange(len(scores))
+    order = contenders[np.lexsort((indices[contenders], -scores[contenders]))][:k]
+    return order[scores[order] > 0]
+
+
+class SimilarityIndex:
+    """Finds the documents of a collection that are most similar to a
+    document, by the cosine similarity of their tf-idf vectors.
+
+    Vectors are kept by word, as postings of (document, weight) sorted
+    by descending weight, so a query only visits the documents that
+    share a word with it. Query words are visited in order of how much
+    they can add to a score. Once the words that are left cannot lift
+    a document that has not been seen yet into the top k, no new
+    documents are considered and the rest of the postings only update
+    the documents already seen; those whose scores can no longer reach
+    the top k are dropped as well. The results are the same as
+    scoring every document.
+
+    A `TfidfVectorizer` already fitted to the documents can be passed
+    in, along with the matrix it transformed them into, so that they
+    are not scored twice.
+
+    >>> from lexicon.music import TextCollection
+    >>> documents = [TextCollection(words.split()) for words in
+    ...              ['sea sun sand', 'sea sun fun', 'city lights', 'city lights fun']]
+    >>> index = SimilarityIndex(documents)
+    >>> [(index.position(match.document), format(match.score, '0.2f'))
+    ...  for match in index.similar(documents[0], k=2)]
+    [(1, '0.47')]
+    >>> [[index.position(match.document) for match in matches]
+    ...  for matches in index.similar_all(documents[2:], k=1)]
+    [[3], [2]]
+    """
+
+    def __init__(self, documents, vectorizer=None, matrix=None):
+        self.documents = list(documents)
+        self.positions = {document: i for i, document in enumerate(self.documents)}
+        self.vectorizer = vectorizer or TfidfVectorizer().fit(self.documents)
+        if matrix is None:
+            matrix = self.vectorizer.transform(self.documents)
+        self.matrix = normalize_rows(matrix)
+        self.matrix.eliminate_zeros()
+
+        # postings of each word, highest weight first
+        postings = self.matrix.tocsc()
+        words = np.repeat(np.arange(postings.shape[1]), np.diff(postings.indptr))
+        order = np.lexsort((postings.indices, -postings.data, words))
+        self.starts = postings.indptr
+        self.postings = postings.indices[order]
+        self.weights = postings.data[order]
+        self.max_weights = np.zeros(postings.shape[1])
+        nonempty = np.diff(self.starts) > 0
+        self.max_weights[nonempty] = self.weights[self.starts[:-1][nonempty]]
+
+    def __len__(self):
+        return len(self.documents)
+
+    def position(self, document):
+        return self.positions.get(document)
+
+    def vectors(self, documents):
+        """Return the unit tf-idf vectors of documents as rows of a
+        matrix, reusing the rows of indexed documents.
+        """
+
+        documents = list(documents)
+        positions = [self.position(document) for document in documents]
+        if all(position is not None for position in positions):
+            return self.matrix[positions]
+        return normalize_rows(self.vectorizer.transform(documents))
+
+    def gather(self, words, query_weights):
+        """Return the documents of the postings of some words
+        and what each posting adds to the score of its document.
+        """
+
+        starts = self.starts[words]
+        lengths = self.starts[words + 1] - starts
+        positions = runs(starts, lengths)
+        contributions = self.weights[positions] * np.repeat(query_weights, lengths)
+        return self.postings[positions], contributions
+
+    def query(self, vector, k=10, exclude=None):
+        """Return the positions and scores of the k documents most
+        similar to a unit vector given as a sparse row, leaving out
+        the document at position `exclude`.
+        """
+
+        # the excluded document can take one of the top places
+        # while scoring, so look for one more to make up for it
+        wanted = k if exclude is None else k + 1
+        bounds = vector.data * self.max_weights[vector.indices]
+        order = np.argsort(-bounds, kind='stable')
+        words, query_weights = vector.indices[order], vector.data[order]
+        # the most that the words from each one on can still add to a
+        # score: at most the sum of their largest weights, and, as every
+        # document has unit length, at most the length of the rest of the
+        # query. A little slack keeps rounding from ever pruning a tie.
+        suffix_bounds = np.cumsum(bounds[order][::-1])[::-1]
+        suffix_lengths = np.sqrt(np.cumsum((query_weights ** 2)[::-1])[::-1])
+        remaining = np.append(np.minimum(suffix_bounds, suffix_lengths), 0) + 1e-9
+
+        n = len(self.documents)
+        scores = np.zeros(n)
+        seen = np.zeros(n, dtype=bool)
+        # score words in blocks of doubling size until a document
+        # not seen yet can no longer make it into the top k
+        done, size, scanned = 0, 8, 0
+        while done < len(words):
+            block = slice(done, min(done + size, len(words)))
+            documents, contributions = self.gather(words[block], query_weights[block])
+            scores += np.bincount(documents, contributions, minlength=n)
+            seen[documents] = True
+            scanned += len(documents)
+            done, size = block.stop, size * 2
+            if seen.sum() >= wanted:
+                kth = np.partition(scores[seen], -wanted)[-wanted]
+                if remaining[done] < kth:
+                    break
+
+        candidates = np.flatnonzero(seen)
+        if done < len(words):
+            # only documents already seen that can still reach the top k
+            # need the rest of the words, which come either from the rows
+            # of those documents or from the postings of the words,
+            # whichever holds fewer entries
+            candidates = candidates[scores[candidates] + remaining[done] >= kth]
+            starts = self.matrix.indptr[candidates]
+            lengths = self.matrix.indptr[candidates + 1] - starts
+            rest = int((self.starts[words[done:] + 1] - self.starts[words[done:]]).sum())
+            if lengths.sum() < rest:
+                query = np.zeros(self.matrix.shape[1])
+                query[words[done:]] = query_weights[done:]
+                positions = runs(starts, lengths)
+                products = self.matrix.data[positions] * query[self.matrix.indices[positions]]
+                owners = np.repeat(np.arange(len(candidates)), lengths)
+                scores[candidates] += np.bincount(owners, products, minlength=len(candidates))
+                instrument.count('similarity.postings_skipped', rest)
+            else:
+                documents, contributions = self.gather(words[done:], query_weights[done:])
+                kept = np.zeros(n, dtype=bool)
+                kept[candidates] = True
+                kept = kept[documents]
+                scores += np.bincount(documents[kept], contributions[kept], minlength=n)
+                scanned += rest
+        instrument.count('similarity.postings_scanned', scanned)
+
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        top = candidates[top_k(candidates, scores[candidates], k)]
+        return top, scores[top]
+
+    def similar(self, document, k=10):
+        """Return the k documents most similar to a document as
+        `Match`es, most similar first. An indexed document is not
+        returned as similar to itself.
+        """
+
+        with instrument.span('similarity.query'):
+            position = self.position(document)
+            if position is None:
+                vector = self.vectors([document])
+            else:
+                vector = self.matrix[position:position + 1]
+            positions, scores = self.query(vector, k, exclude=position)
+        return [Match(self.documents[i], score)
+                for i, score in zip(positions.tolist(), scores.tolist())]
+
+    def similar_all(self, documents, k=10):
+        """Return the `similar` documents of every document at once,
+        such as every song of an album. All scores come from a single
+        product of sparse matrices, which only pairs documents that
+        share a word.
+        """
+
+        with instrument.span('similarity.batch_query'):
+            documents = list(documents)
+            scores = self.vectors(documents) @ self.matrix.T
+            scores = csr_matrix(scores)
+            results = []
+            for row, document in enumerate(documents):
+                start, end = scores.indptr[row], scores.indptr[row + 1]
+                positions, row_scores = scores.indices[start:end], scores.data[start:end]
+                own = self.position(document)
+                if own is not None:
+                    keep = positions != own
+                    positions, row_scores = positions[keep], row_scores[keep]
+                best = top_k(positions, row_scores, k)
+                results.append([Match(self.documents[i], score) for i, score in
+                                zip(positions[best].tolist(), row_scores[best].tolist())])
+        return results
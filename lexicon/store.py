@@ -0,0 +1,332 @@
+"""
+A packed on-disk format for a corpus of songs that any number of
+processes can open at once without copying or unpickling it.
+
+A store is a directory of flat arrays read through `numpy.memmap`:
+
+tokens.u32        the token ids of every song, one song after another
+offsets.i64       where the tokens of each song start, and one past the end
+types.u32         the distinct ids of every song, sorted
+counts.u32        how often each of those ids occurs in its song
+type_offsets.i64  where the types of each song start, and one past the end
+vocabulary.txt    the word of every id, one per line, in alphabetical order
+meta.json         the songs, albums and normalization settings
+
+Numbers are little-endian. Processes that open the same store share
+its pages through the operating system, and a `CorpusStore` is
+pickled as its path alone, so handing it to a worker costs nothing.
+
+$ python -m lexicon.store lyrics/ lyrics.store
+"""
+import os
+import math
+import json
+import argparse
+from collections import namedtuple
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from lexicon import music
+from lexicon.music import Library, get_normalizer
+
+# bump when the layout of a store changes
+VERSION = 1
+
+arrays = {'tokens': ('tokens.u32', '<u4'),
+          'offsets': ('offsets.i64', '<i8'),
+          'types': ('types.u32', '<u4'),
+          'counts': ('counts.u32', '<u4'),
+          'type_offsets': ('type_offsets.i64', '<i8')}
+
+StoredAlbum = namedtuple('StoredAlbum', ['artist', 'title', 'start', 'stop'])
+
+def open_array(path, dtype):
+    # an empty file cannot be mapped
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r')
+
+def write(albums, path, settings=None):
+    """Pack albums of songs, such as those of a `Library`, into a
+    store at path. `settings` records how their words were normalized.
+    """
+
+    albums = list(albums)
+    songs = [song for album in albums for song in album]
+    # ids of the shared vocabulary become ids in alphabetical order
+    used = np.unique(np.concatenate([np.frombuffer(song.types, dtype=np.uint32)
+                                     for song in songs] or [np.zeros(0, np.uint32)]))
+    words = music.vocabulary.decode(used.tolist())
+    order = sorted(range(len(words)), key=words.__getitem__)
+    mapping = np.zeros(len(music.vocabulary), dtype=np.uint32)
+    mapping[used[order]] = np.arange(len(order))
+
+    os.makedirs(path, exist_ok=True)
+    files = {name: open(os.path.join(path, filename), 'wb')
+             for name, (filename, _) in arrays.items()}
+    try:
+        offset = type_offset = 0
+        np.zeros(1, '<i8').tofile(files['offsets'])
+        np.zeros(1, '<i8').tofile(files['type_offsets'])
+        for song in songs:
+            tokens = mapping[np.frombuffer(song.tokens, dtype=np.uint32)]
+            types = mapping[np.frombuffer(song.types, dtype=np.uint32)]
+            counts = np.frombuffer(song.counts, dtype=np.uint32)
+            ranked = np.argsort(types)
+            tokens.astype('<u4').tofile(files['tokens'])
+            types[ranked].astype('<u4').tofile(files['types'])
+            counts[ranked].astype('<u4').tofile(files['counts'])
+            offset += len(tokens)
+            type_offset += len(types)
+            np.array([offset], '<i8').tofile(files['offsets'])
+            np.array([type_offset], '<i8').tofile(files['type_offsets'])
+    finally:
+        for f in files.values():
+            f.close()
+
+    with open(os.path.join(path, 'vocabulary.txt'), 'w', encoding='utf8') as f:
+        f.write('\n'.join(words[i] for i in order))
+    meta = {'version': VERSION,
+            'settings': settings or {},
+            'songs': [{'title': song.title, 'fileid': getattr(song, 'fileid', None)}
+                      for song in songs],
+            'albums': []}
+    start = 0
+    for album in albums:
+        meta['albums'].append({'artist': album.artist, 'title': album.title,
+                               'start': start, 'stop': start + len(album)})
+        start += len(album)
+    # written last, so that a store only opens once it is complete
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf8') as f:
+        json.dump(meta, f, indent=1)
+
+def convert(root, path, processes=None, nostopwords=False, stem=False, lemmatize=False):
+    """Pack every album of a lyrics tree, as found by `Library`,
+    into a store at path and return the opened store.
+    """
+
+    library = Library(root, processes=processes, nostopwords=nostopwords,
+                      stem=stem, lemmatize=lemmatize)
+    settings = get_normalizer(nostopwords, stem, lemmatize).settings()
+    write(library, path, settings)
+    return CorpusStore(path)
+
+
+class StoredSong:
+    """A song of a `CorpusStore`, read straight from the store's
+    arrays. It answers the same questions as a `TextCollection`.
+    """
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    @property
+    def title(self):
+        return self.store.meta['songs'][self.index]['title']
+
+    @property
+    def tokens(self):
+        offsets = self.store.offsets
+        return self.store.tokens[offsets[self.index]:offsets[self.index + 1]]
+
+    @property
+    def types(self):
+        offsets = self.store.type_offsets
+        return self.store.types[offsets[self.index]:offsets[self.index + 1]]
+
+    @property
+    def counts(self):
+        offsets = self.store.type_offsets
+        return self.store.counts[offsets[self.index]:offsets[self.index + 1]]
+
+    def find(self, word):
+        """Return the position of a word in `types`, or None."""
+        i = self.store.id(word)
+        if i is None:
+            return None
+        types = self.types
+        position = int(np.searchsorted(types, i))
+        if position < len(types) and types[position] == i:
+            return position
+        return None
+
+    def __contains__(self, word):
+        return self.find(word) is not None
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return self.size()
+
+    def size(self):
+        offsets = self.store.offsets
+        return int(offsets[self.index + 1] - offsets[self.index])
+
+    def count(self, word):
+        position = self.find(word)
+        return 0 if position is None else int(self.counts[position])
+
+    def freq(self, word):
+        size = self.size()
+        if size == 0:
+            return 0
+        return self.count(word) / size
+
+    @property
+    def words(self):
+        return self.store.decode(self.tokens)
+
+    @property
+    def lexicon(self):
+        return set(self.store.decode(self.types))
+
+    def wordcounts(self):
+        return list(zip(self.store.decode(self.types), self.counts.tolist()))
+
+    def __repr__(self):
+        return "<StoredSong " + str(self.title) + ">"
+
+    def __eq__(self, other):
+        return (isinstance(other, StoredSong) and self.index == other.index
+                and self.store.path == other.store.path)
+
+    def __hash__(self):
+        return hash((self.store.path, self.index))
+
+
+class CorpusStore:
+    """A store written by `write` or `convert`, opened read-only.
+    Indexing it gives `StoredSong`s; the vocabulary is only read
+    when words are first looked up.
+
+    >>> import tempfile
+    >>> root = tempfile.mkdtemp()
+    >>> with open(os.path.join(root, 'ep.json'), 'w') as f:
+    ...     json.dump({'artist': 'Band', 'album': 'EP', 'songs': ['Sea', 'Sky']}, f)
+    >>> os.mkdir(os.path.join(root, 'ep'))
+    >>> for name, text in [('01.txt', 'Sea\\n\\nthe sea the sea'), ('02.txt', 'Sky\\n\\nthe sky')]:
+    ...     with open(os.path.join(root, 'ep', name), 'w') as f:
+    ...         _ = f.write(text)
+    >>> store = convert(root, os.path.join(root, 'ep.store'), processes=1)
+    >>> len(store), store.words
+    (2, ['sea', 'sky', 'the'])
+    >>> store.albums
+    [StoredAlbum(artist='Band', title='EP', start=0, stop=2)]
+    >>> song = store[0]
+    >>> song.title, song.words, song.count('sea'), 'sky' in song
+    ('Sea', ['sea', 'the', 'sea', 'the', 'sea'], 3, False)
+    >>> dict(zip(store.words, store.document_frequencies().tolist()))
+    {'sea': 1, 'sky': 1, 'the': 2}
+    >>> store.document_frequency('the'), store.document_frequency('sun')
+    (2, 0)
+    >>> import pickle
+    >>> len(pickle.dumps(store)) < 200, pickle.loads(pickle.dumps(song)) == song
+    (True, True)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != VERSION:
+            raise ValueError("{} is a store of version {}, not {}".format(
+                path, self.meta['version'], VERSION))
+        for name, (filename, dtype) in arrays.items():
+            setattr(self, name, open_array(os.path.join(path, filename), dtype))
+        self.albums = [StoredAlbum(**album) for album in self.meta['albums']]
+        self._words = self._ids = self._frequencies = None
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+    @property
+    def settings(self):
+        return self.meta['settings']
+
+    @property
+    def words(self):
+        if self._words is None:
+            with open(os.path.join(self.path, 'vocabulary.txt'), encoding='utf8') as f:
+                text = f.read()
+            self._words = text.split('\n') if text else []
+        return self._words
+
+    def id(self, word):
+        """Return the id of a word, or None if no song has it."""
+        if self._ids is None:
+            self._ids = {word: i for i, word in enumerate(self.words)}
+        return self._ids.get(word)
+
+    def decode(self, ids):
+        words = self.words
+        return [words[i] for i in ids.tolist()]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return StoredSong(self, index % len(self))
+
+    def __iter__(self):
+        return (StoredSong(self, i) for i in range(len(self)))
+
+    def songs(self, album):
+        """Return the songs of one of the `albums`."""
+        return [StoredSong(self, i) for i in range(album.start, album.stop)]
+
+    def document_frequencies(self, start=0, stop=None):
+        """Return the number of songs from start to stop
+        that have each word, as an array indexed by id.
+        """
+
+        stop = len(self) if stop is None else stop
+        types = self.types[self.type_offsets[start]:self.type_offsets[stop]]
+        return np.bincount(types, minlength=len(self.words))
+
+    def document_frequency(self, word):
+        """Return the number of songs that have a word, from
+        frequencies counted for the whole store on first use.
+        """
+
+        if self._frequencies is None:
+            self._frequencies = self.document_frequencies()
+        i = self.id(word)
+        return 0 if i is None else int(self._frequencies[i])
+
+    def idf(self, word):
+        return math.log(len(self) / self.document_frequency(word))
+
+    def count_matrix(self):
+        """Return the word counts of every song as a sparse
+        matrix with one row per song and one column per id.
+        """
+
+        return csr_matrix((self.counts.astype(float), self.types, self.type_offsets),
+                          shape=(len(self), len(self.words)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack a tree of lyrics into a corpus store.')
+    parser.add_argument('root', help='directory of albums, as for Library')
+    parser.add_argument('path', help='directory to write the store to')
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--nostopwords', action='store_true')
+    parser.add_argument('--stem', action='store_true')
+    parser.add_argument('--lemmatize', action='store_true')
+    args = parser.parse_args()
+
+    store = convert(args.root, args.path, args.processes, args.nostopwords,
+                    args.stem, args.lemmatize)
+    size = sum(os.path.getsize(os.path.join(args.path, name)) for name in os.listdir(args.path))
+    print("Packed {} songs of {} albums, {} tokens and {} words, into {} ({:.1f} MiB)".format(
+        len(store), len(store.albums), len(store.tokens), len(store.words),
+        args.path, size / 2**20))
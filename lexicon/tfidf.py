@@ -1,11 +1,16 @@
+import os
 import math
 import random
 import heapq
-from collections import namedtuple
-from multiprocessing import Pool
-from functools import partial
+from collections import namedtuple, Counter
+from multiprocessing import Pipe, Process
 
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from lexicon import instrument
 from lexicon.music import Song, Album
+from lexicon.store import CorpusStore
 
 
 class Term(namedtuple('Term', ['word', 'score'])):
@@ -14,16 +19,395 @@ class Term(namedtuple('Term', ['word', 'score'])):
             return self.word < other.word
         return self.score < other.score
 
-def exists(word, document):
-    return word in document
+# what an update of a `CorpusIndex` changed: the words whose document
+# frequencies changed and whether the number of documents did
+Changes = namedtuple('Changes', ['words', 'resized'])
+
+class CorpusIndex:
+    """Document frequencies of every word in a collection of text,
+    built once so that tf-idf scores become dictionary lookups
+    instead of scans over the whole collection. Documents can be
+    added and removed later on.
+
+    >>> from lexicon.music import TextCollection
+    >>> document0 = TextCollection(['dolphin', 'sea', 'world'])
+    >>> document1 = TextCollection(['sea', 'world', 'fun'])
+    >>> index = CorpusIndex([document0, document1])
+    >>> len(index)
+    2
+    >>> index.document_frequency('sea'), index.document_frequency('dolphin')
+    (2, 1)
+    >>> 'fun' in index, 'whale' in index
+    (True, False)
+    >>> document2 = TextCollection(['whale', 'sea', 'world'])
+    >>> changes = index.update(added=[document2], removed=[document1])
+    >>> sorted(changes.words), changes.resized
+    (['fun', 'whale'], False)
+    >>> index.stale([document0, document2], changes) == [document2]
+    True
+    """
+
+    def __init__(self, collection=()):
+        self.frequencies = Counter()
+        self.size = 0
+        if isinstance(collection, CorpusStore):
+            # a store already has every word's frequency in one array
+            frequencies = collection.document_frequencies().tolist()
+            self.frequencies.update(dict(zip(collection.words, frequencies)))
+            self.size = len(collection)
+            return
+        with instrument.span('tfidf.index'):
+            for document in collection:
+                self.add(document)
+
+    def add(self, document):
+        """Count a document and return the words whose
+        document frequencies changed.
+        """
+
+        words = document.lexicon
+        self.frequencies.update(words)
+        self.size += 1
+        return words
+
+    def remove(self, document):
+        """Stop counting a document that was added before and return
+        the words whose document frequencies changed.
+        """
+
+        words = document.lexicon
+        for word in words:
+            self.frequencies[word] -= 1
+            if self.frequencies[word] == 0:
+                del self.frequencies[word]
+        self.size -= 1
+        return words
+
+    def update(self, added=(), removed=()):
+        """Add and remove documents and return the `Changes`."""
+        size = self.size
+        before = {}
+        for document in removed:
+            for word in self.remove(document) - before.keys():
+                before[word] = self.frequencies.get(word, 0) + 1
+        for document in added:
+            for word in self.add(document) - before.keys():
+                before[word] = self.frequencies[word] - 1
+        words = {word for word, frequency in before.items()
+                 if self.frequencies.get(word, 0) != frequency}
+        return Changes(words, self.size != size)
+
+    @staticmethod
+    def stale(documents, changes):
+        """Return the documents whose tf-idf scores are no longer
+        what they were before the `changes`. When the number of
+        documents changed, every idf changed and so does every
+        document; otherwise only documents with a changed word do.
+        """
+
+        if changes.resized:
+            return list(documents)
+        return [document for document in documents
+                if not changes.words.isdisjoint(document.lexicon)]
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, word):
+        return word in self.frequencies
+
+    def document_frequency(self, word):
+        return self.frequencies[word]
+
+    def idf(self, word):
+        return math.log(self.size / self.frequencies[word])
+
+
+def _serve_shard(connection, lexicons):
+    frequencies = Counter()
+    for lexicon in lexicons:
+        frequencies.update(lexicon)
+    while True:
+        words = connection.recv()
+        if words is None:
+            break
+        connection.send([frequencies[word] for word in words])
+    connection.close()
+
+def _serve_store_shard(connection, store, start, stop):
+    # the store arrives as its path and is mapped, not copied
+    frequencies = store.document_frequencies(start, stop)
+    while True:
+        ids = connection.recv()
+        if ids is None:
+            break
+        connection.send([int(frequencies[i]) if i >= 0 else 0 for i in ids])
+    connection.close()
+
+class DocumentFrequencyPool:
+    """A pool of worker processes, one per core, that each keep
+    a shard of a collection resident and count document frequencies
+    for many words per round trip.
+
+    The pool can be passed to `tfidf` and `important_words` in place
+    of the collection and should be reused across calls.
+
+    Given a `CorpusStore`, each worker maps a range of its songs
+    instead of being sent their words, and words are sent to the
+    workers as ids.
+
+    >>> from lexicon.music import TextCollection
+    >>> document0 = TextCollection(['dolphin', 'sea', 'world'])
+    >>> document1 = TextCollection(['sea', 'world', 'fun'])
+    >>> with DocumentFrequencyPool([document0, document1], processes=2) as pool:
+    ...     pool.document_frequencies(['sea', 'dolphin', 'whale'])
+    [2, 1, 0]
+    """
+
+    def __init__(self, collection, processes=None):
+        self.store = collection if isinstance(collection, CorpusStore) else None
+        if self.store is None:
+            collection = list(collection)
+        self.size = len(collection)
+        processes = max(1, min(processes or os.cpu_count(), self.size))
+        bounds = np.linspace(0, self.size, processes + 1).astype(int).tolist()
+        self.workers = []
+        for i in range(processes):
+            if self.store is None:
+                target = _serve_shard
+                shard = ([document.lexicon for document in collection[i::processes]],)
+            else:
+                target = _serve_store_shard
+                shard = (self.store, bounds[i], bounds[i + 1])
+            connection, worker_connection = Pipe()
+            process = Process(target=target,
+                              args=(worker_connection,) + shard,
+                              daemon=True)
+            process.start()
+            worker_connection.close()
+            self.workers.append((process, connection))
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for process, connection in self.workers:
+            connection.send(None)
+            connection.close()
+            process.join()
+        self.workers = []
+
+    def document_frequencies(self, words):
+        words = list(words)
+        if self.store is not None:
+            words = [self.store.id(word) for word in words]
+            words = [-1 if i is None else i for i in words]
+        for _, connection in self.workers:
+            connection.send(words)
+        totals = [0] * len(words)
+        for _, connection in self.workers:
+            for i, count in enumerate(connection.recv()):
+                totals[i] += count
+        return totals
+
+    def index(self, words):
+        """Return a `CorpusIndex` of the collection restricted to
+        the given words, fetched in a single round trip.
+        """
+
+        index = CorpusIndex()
+        index.size = self.size
+        words = list(words)
+        index.frequencies.update(dict(zip(words, self.document_frequencies(words))))
+        return index
+
+    def idf(self, word):
+        return self.index([word]).idf(word)
+
+def document_term_matrix(documents, vocabulary, binary=False):
+    """Return a sparse matrix with one row per document and one column
+    per word of `vocabulary`, a dict mapping words to column ids. Cells
+    hold word counts, or 1 where a word occurs if `binary` is set.
+    Documents are TextCollections or plain lists of words.
+
+    >>> matrix = document_term_matrix([['la', 'la', 'di'], ['da']], {'di': 0, 'la': 1})
+    >>> matrix.toarray().tolist()
+    [[1.0, 2.0], [0.0, 0.0]]
+    >>> document_term_matrix([['la', 'la', 'di']], {'di': 0, 'la': 1}, binary=True).toarray().tolist()
+    [[1.0, 1.0]]
+    """
+
+    indptr, indices, data = [0], [], []
+    for document in documents:
+        if hasattr(document, 'wordcounts'):
+            wordcounts = document.wordcounts()
+        else:
+            wordcounts = Counter(document).items()
+        for word, count in wordcounts:
+            i = vocabulary.get(word)
+            if i is not None:
+                indices.append(i)
+                data.append(1 if binary else count)
+        indptr.append(len(indices))
+    matrix = csr_matrix((np.array(data, dtype=float),
+                         np.array(indices, dtype=np.int64),
+                         np.array(indptr, dtype=np.int64)),
+                        shape=(len(indptr) - 1, len(vocabulary)))
+    matrix.sort_indices()
+    return matrix
+
+class TfidfVectorizer:
+    """Scores every word of every document in a collection at once.
+    The vocabulary of the collection is mapped to integer ids and
+    the scores are stored in a sparse matrix with one row per
+    document, identical to what `tfidf` returns for each pair.
+
+    >>> from lexicon.music import TextCollection
+    >>> document0 = TextCollection(['dolphin', 'sea', 'world', 'sea'])
+    >>> document1 = TextCollection(['sea', 'world', 'fun'])
+    >>> collection = [document0, document1]
+    >>> vectorizer = TfidfVectorizer().fit(collection)
+    >>> vectorizer.words
+    ['dolphin', 'fun', 'sea', 'world']
+    >>> matrix = vectorizer.transform(collection)
+    >>> matrix.shape
+    (2, 4)
+    >>> format(matrix[0, vectorizer.vocabulary['dolphin']], '0.2f')
+    '0.69'
+    >>> [term.word for term in vectorizer.important_words(matrix, n=1)[1]]
+    ['fun']
+
+    Counts of documents never change, so they can be kept and scaled
+    again with `scale` after the collection is updated.
+
+    >>> counts = vectorizer.counts(collection)
+    >>> document2 = TextCollection(['whale', 'sea'])
+    >>> changes = vectorizer.update(added=[document2])
+    >>> vectorizer.words[-1], vectorizer.stale(collection, changes) == collection
+    ('whale', True)
+    >>> format(vectorizer.scale(counts)[0, vectorizer.vocabulary['dolphin']], '0.2f')
+    '1.10'
+    """
+
+    def __init__(self):
+        self.index = CorpusIndex()
+        self.words = []
+        self.vocabulary = {}
+        self.ranks = np.zeros(0, dtype=np.int64)
+        self.idf = np.zeros(0)
+
+    def fit(self, collection):
+        with instrument.span('tfidf.vectorizer_fit'):
+            self.index = CorpusIndex(collection)
+            # ids start out in alphabetical order; `ranks` keeps that
+            # order for words added later so that ties between scores
+            # are broken the same way `Term` does
+            self.words = sorted(self.index.frequencies)
+            self.vocabulary = {word: i for i, word in enumerate(self.words)}
+            self.ranks = np.arange(len(self.words))
+            self.idf = np.array([self.index.idf(word) for word in self.words])
+        return self
+
+    def update(self, added=(), removed=()):
+        """Add documents to and remove documents from the fitted
+        collection without fitting it again, and return the `Changes`.
+        New words get the next ids; words that are no longer in any
+        document keep theirs with an idf of 0.
+        """
+
+        changes = self.index.update(added, removed)
+        new_words = sorted(word for word in changes.words if word not in self.vocabulary)
+        for word in new_words:
+            self.vocabulary[word] = len(self.words)
+            self.words.append(word)
+        if new_words:
+            order = sorted(range(len(self.words)), key=self.words.__getitem__)
+            self.ranks = np.empty(len(self.words), dtype=np.int64)
+            self.ranks[order] = np.arange(len(self.words))
+        if changes.resized:
+            self.idf = np.array([self.index.idf(word) if word in self.index else 0.0
+                                 for word in self.words])
+        else:
+            self.idf = np.append(self.idf, np.zeros(len(new_words)))
+            for word in changes.words:
+                self.idf[self.vocabulary[word]] = (self.index.idf(word)
+                                                   if word in self.index else 0.0)
+        return changes
+
+    def stale(self, documents, changes):
+        return self.index.stale(documents, changes)
+
+    def counts(self, documents):
+        """Return a sparse matrix of raw word counts, one row per document.
+        Words outside of the fitted vocabulary are ignored.
+        """
+
+        return document_term_matrix(documents, self.vocabulary)
+
+    def scale(self, counts, copy=True):
+        """Return a matrix of counts from `counts` scaled into tf-idf
+        scores by the current idf. Counts from before words were added
+        to the vocabulary are widened to match.
+        """
+
+        matrix = counts.copy() if copy else counts
+        if matrix.shape[1] < len(self.words):
+            matrix.resize((matrix.shape[0], len(self.words)))
+        # scaling in place keeps the explicit zeros of words
+        # that appear in every document, as `important_words` does
+        matrix.data *= self.idf[matrix.indices]
+        return matrix
+
+    def transform(self, documents):
+        with instrument.span('tfidf.vectorizer_counts'):
+            matrix = self.counts(documents)
+        return self.scale(matrix, copy=False)
+
+    def fit_transform(self, collection):
+        return self.fit(collection).transform(collection)
+
+    def important_words(self, matrix, n=None):
+        """Return the n most important words of every row of
+        a matrix from `transform` as lists of `Term`s, highest first.
+        If n is None then all terms of each row will be returned.
+        """
+
+        with instrument.span('tfidf.vectorizer_important_words'):
+            lengths = np.diff(matrix.indptr)
+            rows = np.repeat(np.arange(matrix.shape[0]), lengths)
+            # sort each row by descending score, then descending word
+            order = np.lexsort((-self.ranks[matrix.indices], -matrix.data, rows))
+            if n is not None:
+                rank = np.arange(len(order)) - np.repeat(matrix.indptr[:-1], lengths)
+                order = order[rank < n]
+                lengths = np.minimum(lengths, n)
+            ends = np.cumsum(lengths)
+            indices = matrix.indices[order].tolist()
+            scores = matrix.data[order].tolist()
+            return [[Term(self.words[i], score)
+                     for i, score in zip(indices[end - length:end], scores[end - length:end])]
+                    for end, length in zip(ends.tolist(), lengths.tolist())]
+
 
 def tfidf(word, document, collection, parallel=False):
     """Return the tf-idf score of a word
     in a document with respect to a collection of text.
 
+    `collection` may also be a `CorpusIndex` or a `CorpusStore`,
+    in which case the score is computed without scanning the
+    collection, or a `DocumentFrequencyPool`.
+
     `parallel` should only be used for collections
     with a large number of documents because 
-    of some overhead.
+    of some overhead. It starts a `DocumentFrequencyPool`
+    for this one call; pass a pool as the collection
+    instead to reuse its workers.
 
     TODO: offer more settings, such as count frequency vs
     proportional frequency
@@ -38,18 +422,21 @@ def tfidf(word, document, collection, parallel=False):
     >>> score = tfidf(word, document0, [document0, document1], parallel=True)
     >>> format(score, '0.2f')
     '0.69'
+    >>> index = CorpusIndex([document0, document1])
+    >>> format(tfidf(word, document0, index), '0.2f')
+    '0.69'
     """
 
+    instrument.count('tfidf.calls')
     tf = document.count(word)
+    if isinstance(collection, (CorpusIndex, CorpusStore, DocumentFrequencyPool)):
+        return tf * collection.idf(word)
     if parallel:
-        pool = Pool(len(collection))
-        exist = partial(exists, word)
-        appearances = pool.map(exist, collection)
-        appearances = sum(appearances)
-        pool.close()
-        pool.join()
-    else:
+        with DocumentFrequencyPool(collection) as pool:
+            return tf * pool.idf(word)
+    with instrument.span('tfidf.scan'):
         appearances = sum(word in doc for doc in collection)
+    instrument.count('tfidf.documents_scanned', len(collection))
     idf = math.log(len(collection) / appearances)
     return tf * idf
 
@@ -60,6 +447,10 @@ def important_words(document, collection, n=None):
     namedtuples `Term`s.
     If n is None then all terms will be returned.
 
+    `collection` may be a prebuilt `CorpusIndex`, a `CorpusStore`
+    or a `DocumentFrequencyPool`; scoring many documents against
+    the same collection should reuse one.
+
     >>> damn = Album('lyrics/kendrick/damn.json')
     >>> dna = damn[1]
     >>> terms = important_words(dna, damn, 5)
@@ -92,6 +483,10 @@ def important_words(document, collection, n=None):
             return more + equal[:n - len(more)]
         return more + equal + n_largest(less, n - len(more) - len(equal))
 
+    if isinstance(collection, DocumentFrequencyPool):
+        collection = collection.index(document.lexicon)
+    elif not isinstance(collection, (CorpusIndex, CorpusStore)):
+        collection = CorpusIndex(collection)
     terms = [Term(word, tfidf(word, document, collection)) for word in document.lexicon]
     return n_largest(terms, n)
 
@@ -43,27 +43,24 @@ kmeans = KMeans(n_clusters=2).fit(X)
 
 if __name__ == '__main__':
     from lexicon.music import Album, Song
-    from lexicon.tfidf import tfidf, important_words, Term
+    from lexicon.tfidf import TfidfVectorizer
     albums = [Album('lyrics/kendrick/tpab.json'),
               Album('lyrics/taylor/red.json')]
 
     # collect the n most important words from each song
     # `important_words` is based on highest tfidf score
     all_songs = [song for album in albums for song in album]
+    vectorizer = TfidfVectorizer()
+    matrix = vectorizer.fit_transform(all_songs)
     vocab = set()
-    for song in all_songs:
-        imp_words = important_words(song, all_songs, n=3)
+    for imp_words in vectorizer.important_words(matrix, n=3):
         vocab.update([t.word for t in imp_words])
     
     # vocab = {'york', 'heard', 'shake'}
 
     vocab = list(vocab)
-    wsvecs = []
-    for song in all_songs:
-        terms = []
-        for word in vocab:
-            terms.append(Term(word=word, score=tfidf(word, song, all_songs)))
-        wsvecs.append(dict(terms))
+    columns = [vectorizer.vocabulary[word] for word in vocab]
+    wsvecs = [dict(zip(vocab, row)) for row in matrix[:, columns].toarray().tolist()]
     X = np.array([normalize(dict2list(v)) for v in wsvecs])
     kmeans = KMeans(n_clusters=2).fit(X)
     print(kmeans.labels_)
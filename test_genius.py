@@ -0,0 +1,160 @@
+import os
+import json
+import asyncio
+import tempfile
+import pytest
+from aiohttp import web
+
+from lexicon.genius import AsyncFetcher, ResponseCache
+
+ARTIST = 'Kendrick Lamar'
+SONGS = ['DNA.', 'HUMBLE.', 'LOYALTY.']
+
+
+class StandIn:
+    """A local server that mimics the Genius search and song
+    endpoints and the lyrics pages of genius.com.
+    The first request for every lyrics page fails with a 429.
+    Pages of the songs in `broken` have no lyrics div, and
+    searches for the songs in `unlisted` have no hit by the artist.
+    """
+
+    def __init__(self, broken=(), unlisted=()):
+        self.broken = set(broken)
+        self.unlisted = set(unlisted)
+        self.requests = []
+        self.throttled = set()
+        self.in_flight = 0
+        self.most_in_flight = 0
+        app = web.Application()
+        app.router.add_get('/search', self.search)
+        app.router.add_get('/songs/{id}', self.song)
+        app.router.add_get('/lyrics/{id}', self.page)
+        self.app = app
+
+    async def track(self, request):
+        self.requests.append(request.path)
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+    async def search(self, request):
+        await self.track(request)
+        title = request.query['q'].replace(' ' + ARTIST, '')
+        hits = [{'result': {'primary_artist': {'name': 'Someone Else'}, 'api_path': '/songs/0'}}]
+        if title not in self.unlisted:
+            hits.append({'result': {'primary_artist': {'name': ARTIST},
+                                    'api_path': '/songs/{}'.format(SONGS.index(title) + 1)}})
+        return web.json_response({'response': {'hits': hits}})
+
+    async def song(self, request):
+        await self.track(request)
+        assert request.headers['Authorization'] == 'Bearer token'
+        path = '/lyrics/' + request.match_info['id']
+        return web.json_response({'response': {'song': {'path': path}}})
+
+    async def page(self, request):
+        await self.track(request)
+        if request.path not in self.throttled:
+            self.throttled.add(request.path)
+            return web.Response(status=429, headers={'Retry-After': '0'})
+        i = int(request.match_info['id'])
+        if SONGS[i - 1] in self.broken:
+            return web.Response(text='<html><p>Not found</p></html>', content_type='text/html')
+        html = ('<html><script>var x;</script><div class="lyrics">\n[Verse]\n'
+                'Song {} lyrics\n[Chorus]\nla la</div></html>'.format(i))
+        return web.Response(text=html, content_type='text/html')
+
+
+async def with_stand_in(run, stand_in=None, **options):
+    """Return the stand-in and what `run` returns for
+    each fetcher that it is called with in turn.
+    """
+
+    stand_in = stand_in or StandIn()
+    runner = web.AppRunner(stand_in.app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    url = 'http://127.0.0.1:{}'.format(port)
+    try:
+        results = []
+        for _ in range(options.pop('runs', 1)):
+            async with AsyncFetcher('token', api_url=url, web_url=url, backoff=0,
+                                    **options) as fetcher:
+                results.append(await run(fetcher))
+    finally:
+        await runner.cleanup()
+    return stand_in, results
+
+
+def album_file():
+    directory = tempfile.mkdtemp()
+    album_file = os.path.join(directory, 'damn.json')
+    with open(album_file, 'w') as f:
+        json.dump({'artist': ARTIST, 'album': 'DAMN.', 'songs': SONGS}, f)
+    return album_file, os.path.join(directory, 'damn')
+
+
+@pytest.mark.parametrize('parser', ['soup', 'stream'])
+def test_fetch_album(parser):
+    album, target_directory = album_file()
+    fetch = lambda fetcher: fetcher.fetch_album(album, target_directory)
+    stand_in, [retrieved] = asyncio.run(with_stand_in(fetch, concurrency=2, parser=parser))
+    assert retrieved == [0, 1, 2]
+    assert stand_in.most_in_flight <= 2
+    # every page was throttled once and then retried
+    assert sum(path.startswith('/lyrics/') for path in stand_in.requests) == 6
+    assert sorted(os.listdir(target_directory)) == ['00.txt', '01.txt', '02.txt']
+    with open(os.path.join(target_directory, '01.txt')) as f:
+        assert f.read() == 'HUMBLE.\n\nSong 2 lyrics\nla la'
+
+
+@pytest.mark.parametrize('parser', ['soup', 'stream'])
+def test_fetch_album_with_a_page_without_lyrics(parser):
+    album, target_directory = album_file()
+    fetch = lambda fetcher: fetcher.fetch_album(album, target_directory)
+    stand_in = StandIn(broken=['HUMBLE.'])
+    _, [retrieved] = asyncio.run(with_stand_in(fetch, stand_in, parser=parser))
+    assert retrieved == [0, 2]
+    assert sorted(os.listdir(target_directory)) == ['00.txt', '02.txt']
+
+
+def test_sync_album():
+    album, target_directory = album_file()
+    stand_in = StandIn()
+    requests_before = []
+
+    async def sync(fetcher):
+        requests_before.append(len(stand_in.requests))
+        if len(requests_before) == 2:
+            os.remove(os.path.join(target_directory, '02.txt'))
+        return await fetcher.sync_album(album, target_directory)
+
+    cache = ResponseCache(tempfile.mkdtemp())
+    _, results = asyncio.run(with_stand_in(sync, stand_in, runs=3, cache=cache))
+
+    assert results == [[0, 1, 2], [2], []]
+    # the second run only fetches the deleted song, with its
+    # search and song responses coming from the cache
+    assert stand_in.requests[requests_before[1]:requests_before[2]] == ['/lyrics/3']
+    assert len(stand_in.requests) == requests_before[2]
+    with open(os.path.join(target_directory, 'manifest.json')) as f:
+        assert sorted(json.load(f)['tracks']) == ['0', '1', '2']
+
+
+def test_sync_album_retries_songs_not_found():
+    album, target_directory = album_file()
+    stand_in = StandIn(unlisted=['HUMBLE.'])
+
+    async def sync(fetcher):
+        retrieved = await fetcher.sync_album(album, target_directory)
+        # the song is added to Genius before the next run
+        stand_in.unlisted.clear()
+        return retrieved
+
+    cache = ResponseCache(tempfile.mkdtemp())
+    _, results = asyncio.run(with_stand_in(sync, stand_in, runs=2, cache=cache))
+    assert results == [[0, 2], [1]]
@@ -0,0 +1,79 @@
+import json
+import tempfile
+import threading
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.corpus import generate
+from lexicon import music
+from lexicon.music import Library
+from lexicon.tfidf import important_words
+from lexicon.server import Service, Server
+
+
+@pytest.fixture(scope='module')
+def server():
+    root = tempfile.mkdtemp()
+    generate(root, songs=40, artists=2, songs_per_album=10, words_per_song=60, seed=1)
+    # keep the generated songs out of the token cache in the home directory
+    token_cache, music.token_cache = music.token_cache, None
+    try:
+        library = Library(root, processes=1)
+    finally:
+        music.token_cache = token_cache
+    server = Server(Service(library), ('127.0.0.1', 0), cache_size=8)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def get(server, path):
+    with urlopen('http://127.0.0.1:{}{}'.format(server.server_address[1], path)) as response:
+        return json.loads(response.read())
+
+def test_queries(server):
+    service = server.service
+    songs = get(server, '/songs')
+    assert len(songs) == 40
+    assert songs[12] == {'song': 12, 'title': service.songs[12].title,
+                         'album': 'Album 1', 'artist': 'Artist 0'}
+
+    terms = get(server, '/important_words?song=3&n=5')
+    expected = sorted(important_words(service.songs[3], service.songs, 5), reverse=True)
+    # words with equal scores may come in either order
+    assert [term['score'] for term in terms] == pytest.approx([term.score for term in expected])
+
+    word = terms[0]['word']
+    assert get(server, '/tfidf?song=3&word=' + word) == pytest.approx(terms[0]['score'])
+    assert get(server, '/count?song=3&word=' + word) == service.songs[3].count(word)
+    assert get(server, '/count?word=' + word) == sum(song.count(word) for song in service.songs)
+
+    similar = get(server, '/similar?song=3&k=4')
+    assert len(similar) == 4 and 3 not in [match['song'] for match in similar]
+    assert similar == sorted(similar, key=lambda match: -match['score'])
+
+def test_errors(server):
+    for path, status in [('/similar?song=400', 404), ('/nothing', 404),
+                         ('/similar?song=x', 400), ('/tfidf?song=1', 400),
+                         ('/similar?song=3&k=-2', 400), ('/important_words?song=3&n=-1', 400),
+                         ('/similar?song=3&k=two', 400)]:
+        with pytest.raises(HTTPError) as error:
+            get(server, path)
+        assert error.value.code == status
+
+def test_concurrent_requests_are_cached(server):
+    paths = ['/similar?song={}&k=3'.format(i % 4) for i in range(32)]
+    # the first answers are cached before the burst, so every request of it is a hit
+    first = [get(server, path) for path in paths[:4]]
+    before = get(server, '/stats')
+    with ThreadPoolExecutor(8) as executor:
+        answers = list(executor.map(lambda path: get(server, path), paths))
+    assert answers == first * 8
+    after = get(server, '/stats')
+    assert after['hits'] - before['hits'] == 32
+    assert after['misses'] == before['misses']
+    assert after['size'] <= 8